@@ -0,0 +1,183 @@
+"""
+Intraday analytics per symbol, kept up to date tick by tick.
+
+SymbolStats.update() is O(1) per tick (amortised: each tick enters and
+leaves a rolling window once) and maintains
+
+    open, high, low      this session (TradingHours.session; the UTC day without hours)
+    vwap                 volume-weighted average price this session, from increases in
+                         the cumulative traded volume the feed reports (None without volume)
+    return_1m/5m         simple return over the last 1 / 5 minutes, in percent
+    volatility_1m/5m     realized volatility over the same windows (root of the summed
+                         squared log returns), in percent
+
+Ticks only cover the time a symbol was subscribed: session_range() takes
+the source's own session open/high/low where it has them (IB's ticker
+fields), and gap() keeps a resubscription from bridging the silence with one
+big return or volume step.
+
+SymbolStats.load() computes the same state from stored tick arrays (a
+journal scan or a TickRing snapshot) in whole-array passes - min/max, map
+and fsum over slices - instead of replaying ticks one by one; batch_stats()
+wraps it for one-off use.
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+from collections import deque
+from operator import mul, sub, truediv
+
+WINDOWS = {'1m': 60, '5m': 300}  # Rolling windows, in seconds
+FIELDS = ('open', 'high', 'low', 'vwap') + tuple(
+    '%s_%s' % (measure, name) for measure in ('return', 'volatility') for name in WINDOWS
+)
+
+
+def utc_day(when):
+    """Session bounds for symbols without trading hours: the UTC day."""
+    start = when // 86400 * 86400
+    return start, start + 86400
+
+
+class RollingWindow:
+    """Log returns of ticks in the last `seconds`, with running sums."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._returns = deque()  # (ts, log return)
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def add(self, ts, log_return):
+        self._returns.append((ts, log_return))
+        self._sum += log_return
+        self._sum_sq += log_return * log_return
+        self.expire(ts)
+
+    def expire(self, now):
+        cutoff = now - self.seconds
+        returns = self._returns
+        while returns and returns[0][0] <= cutoff:
+            _, log_return = returns.popleft()
+            self._sum -= log_return
+            self._sum_sq -= log_return * log_return
+        if not returns:
+            self._sum = self._sum_sq = 0.0  # Don't let rounding drift carry over
+
+    def load(self, ts, log_returns):
+        """Replace the contents with parallel arrays of timestamps and log returns."""
+        self._returns = deque(zip(ts, log_returns))
+        self._sum = math.fsum(log_returns)
+        self._sum_sq = math.fsum(map(mul, log_returns, log_returns))
+
+    @property
+    def return_pct(self):
+        return math.expm1(self._sum) * 100
+
+    @property
+    def volatility_pct(self):
+        return math.sqrt(max(self._sum_sq, 0.0)) * 100
+
+
+class SymbolStats:
+    def __init__(self, session=utc_day):
+        self.session = session  # session(ts) -> (start, next session's start) epochs
+        self.windows = {name: RollingWindow(seconds) for name, seconds in WINDOWS.items()}
+        self.open = self.high = self.low = None
+        self._session_start = None
+        self._next_session = None
+        self._turnover = 0.0     # Sum of price x traded volume this session
+        self._traded = 0.0       # Volume traded this session
+        self._last_price = None
+        self._last_volume = 0.0  # Cumulative volume at the previous tick (0 = unknown)
+
+    def update(self, ts, price, volume=0.0):
+        """Take one tick: `volume` is the feed's cumulative traded volume (0 if it has none)."""
+        if self._next_session is None or not self._session_start <= ts < self._next_session:
+            self._session_start, self._next_session = self.session(ts)
+            self.open = self.high = self.low = price
+            self._turnover = self._traded = 0.0
+        elif price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+
+        if volume > 0:
+            if volume > self._last_volume > 0:
+                traded = volume - self._last_volume
+                self._turnover += traded * price
+                self._traded += traded
+            self._last_volume = volume  # A drop is the feed's daily reset: just a new baseline
+
+        if self._last_price:
+            log_return = math.log(price / self._last_price)
+            for window in self.windows.values():
+                window.add(ts, log_return)
+        self._last_price = price
+
+    def session_range(self, open, high, low):
+        """The source's session open/high/low (None or NaN where unknown), after update()."""
+        if self.open is None:
+            return
+        if open is not None and open > 0:  # NaN compares False
+            self.open = open
+        if high is not None and high > self.high:
+            self.high = high
+        if low is not None and 0 < low < self.low:
+            self.low = low
+
+    def gap(self):
+        """Ticks stopped and start again (resubscribed): the next one has no previous price or volume."""
+        self._last_price = None
+        self._last_volume = 0.0
+
+    def load(self, ts, price, volume=None):
+        """Rebuild the state from tick arrays in time order (what update() would give for each tick)."""
+        self.__init__(self.session)
+        if not ts:
+            return
+        now = ts[-1]
+        self._session_start, self._next_session = self.session(now)
+        start = bisect_left(ts, self._session_start)
+        session = price[start:]
+        if session:
+            self.open, self.high, self.low = session[0], max(session), min(session)
+
+        if volume:
+            # Traded volume between consecutive ticks: increases only, and only after a known volume
+            first = max(start, 1)
+            traded = list(map(mul, map(max, map(sub, volume[first:], volume[first - 1:-1]), [0.0] * len(ts)),
+                              map(bool, volume[first - 1:-1])))
+            self._traded = math.fsum(traded)
+            self._turnover = math.fsum(map(mul, traded, price[first:]))
+            self._last_volume = next((v for v in reversed(volume) if v > 0), 0.0)
+
+        # Log returns of the ticks inside the longest window (each against the tick before it)
+        first = max(bisect_right(ts, now - max(WINDOWS.values())), 1)
+        recent_ts = ts[first:]
+        log_returns = list(map(math.log, map(truediv, price[first:], price[first - 1:-1])))
+        for window in self.windows.values():
+            inside = bisect_right(recent_ts, now - window.seconds)
+            window.load(recent_ts[inside:], log_returns[inside:])
+        self._last_price = price[-1]
+
+    def fields(self, now=None):
+        """The statistics as of `now` (default: the last tick), keyed as in FIELDS."""
+        if now is not None:
+            for window in self.windows.values():
+                window.expire(now)
+        fields = {
+            'open': self.open, 'high': self.high, 'low': self.low,
+            'vwap': self._turnover / self._traded if self._traded else None,
+        }
+        for name, window in self.windows.items():
+            fields['return_' + name] = round(window.return_pct, 4)
+            fields['volatility_' + name] = round(window.volatility_pct, 4)
+        return fields
+
+
+def batch_stats(ts, price, volume=None, session=utc_day, now=None):
+    """FIELDS for a whole tick history at once, e.g. to check or backfill the incremental figures."""
+    stats = SymbolStats(session)
+    stats.load(ts, price, volume)
+    return stats.fields(now)
@@ -0,0 +1,332 @@
+"""
+Asyncio serving mode: HTTP and the price feed on one event loop.
+
+The threaded server (server.py / gunicorn) needs a thread per open stream or
+long-poll. Here every connection is a coroutine, so one process can hold
+thousands of idle displays. The feed runs as a task on the same loop
+(server.run_feed_async); for IB that means ib_insync reads the socket on
+this loop instead of its own thread and loop.
+
+Served natively: static files, /api/prices (full, ETag/304, delta and
+long-poll) and /api/stream (Server-Sent Events). Every other route goes to
+the Flask app in server.py, called inline; those are all quick.
+
+Run:  python asgi.py                      (uvicorn, PORT as for server.py)
+      uvicorn asgi:app --port 8080 --no-access-log --loop asyncio
+The IB feed needs the plain asyncio loop (ib_insync nests its calls on it,
+which uvloop doesn't allow), hence --loop asyncio: uvicorn[standard] would
+otherwise pick uvloop.
+Thousands of connections need a higher open-files limit (ulimit -n).
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_accept_header
+
+os.environ['WALLCLOCK_ROLE'] = 'async'  # Must be set before server is imported
+
+import server
+from staticfiles import etag, pick_encoding
+
+STATIC_PATHS = {('/' + name if name != 'index.html' else '/'): name for name in server.static_files.files}
+UNAVAILABLE = json.dumps({'error': 'Waiting for IB Gateway connection...', 'retry': True}).encode('utf-8')
+
+
+class PriceChanges:
+    """Wakes every coroutine waiting for the next price version."""
+
+    def __init__(self):
+        self._loop = None
+        self._event = None
+
+    def bind(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def notify(self):
+        # Called from whichever thread published (normally the loop's own feed task)
+        self._loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout):
+        """Wait up to `timeout` seconds for a new version; False on timeout."""
+        try:
+            async with asyncio.timeout(timeout):
+                await self._event.wait()
+            return True
+        except TimeoutError:
+            return False
+
+
+changes = PriceChanges()
+_feed = None
+_feed_task = None
+
+
+# ============== Request helpers ==============
+
+def request_headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def query_args(scope):
+    return {name: values[-1] for name, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+
+
+def accepted_encodings(header):
+    """Accept-Encoding parsed as Flask's request.accept_encodings is: [coding] gives its quality (0 = no)."""
+    return parse_accept_header(header)
+
+
+def etag_matches(header, tag):
+    """If-None-Match check (weak comparison)."""
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/').strip('"') == tag:
+            return True
+    return False
+
+
+async def respond(send, status, body=b'', headers=(), head=False):
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    headers.append((b'content-length', str(len(body)).encode('ascii')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+
+def observe(route, status, started):
+    server.HTTP_REQUESTS.inc(route, str(status))
+    server.HTTP_DURATION.observe(time.perf_counter() - started, route)
+
+
+# ============== Native routes ==============
+
+async def static_file(scope, send, headers, name):
+    static = server.static_files.files[name]
+    coding = pick_encoding(static, accepted_encodings(headers.get('accept-encoding', '')))
+    tag = etag(static, coding)
+    response_headers = [('etag', '"%s"' % tag), ('cache-control', static.cache_control)]
+    if len(static.bodies) > 1:
+        response_headers.append(('vary', 'Accept-Encoding'))
+    if etag_matches(headers.get('if-none-match', ''), tag):
+        await respond(send, 304, headers=response_headers)
+        return 304
+    response_headers.append(('content-type', static.mimetype))
+    if coding:
+        response_headers.append(('content-encoding', coding))
+    await respond(send, 200, static.bodies[coding], response_headers, head=scope['method'] == 'HEAD')
+    return 200
+
+
+async def prices(scope, send, headers):
+    """/api/prices, as in server.api_prices / server.prices_since."""
+    args = query_args(scope)
+    server.viewer_demand.touch(server.requested_keys(args.get('symbols')))
+    try:
+        since = int(args['since']) if 'since' in args else None
+        wait = float(args.get('wait', 0))
+    except ValueError:
+        since, wait = None, 0.0
+
+    if since is not None:
+        deadline = time.monotonic() + max(0.0, min(wait, server.LONG_POLL_MAX_SEC))
+        while server.price_snapshot.version == since and time.monotonic() < deadline:
+            await changes.wait(deadline - time.monotonic())
+    snapshot = server.price_snapshot
+
+    if snapshot.data is None:
+        server.PRICE_RESPONSES.inc('unavailable')
+        await respond(send, 503, UNAVAILABLE, [('content-type', 'application/json')])
+        return 503
+
+    if since is not None:
+        server.PRICE_RESPONSES.inc('delta')
+        body = json.dumps(server.delta_payload(snapshot, since), separators=(',', ':')).encode('utf-8')
+        await respond(send, 200, body, [('content-type', 'application/json'), ('cache-control', 'no-store')])
+        return 200
+
+    coding = 'gzip' if accepted_encodings(headers.get('accept-encoding', ''))['gzip'] > 0 else ''
+    tag = server.price_etag(snapshot, coding)
+    response_headers = [('etag', tag), ('cache-control', 'no-cache'), ('vary', 'Accept-Encoding')]
+    if etag_matches(headers.get('if-none-match', ''), tag.strip('"')):
+        server.PRICE_RESPONSES.inc('not_modified')
+        await respond(send, 304, headers=response_headers)
+        return 304
+    server.PRICE_RESPONSES.inc('full')
+    response_headers.append(('content-type', 'application/json'))
+    if coding:
+        response_headers.append(('content-encoding', 'gzip'))
+        await respond(send, 200, snapshot.gzip_body, response_headers)
+    else:
+        await respond(send, 200, snapshot.body, response_headers)
+    return 200
+
+
+async def stream(scope, receive, send, headers):
+    """/api/stream, as in server.api_stream: one coroutine per display, however many there are."""
+    args = query_args(scope)
+    try:
+        seen = int(headers.get('last-event-id') or args.get('lastEventId') or -1)
+    except ValueError:
+        seen = -1
+    keys = server.requested_keys(args.get('symbols'))
+
+    # The client going away cancels this coroutine, wherever it is waiting
+    handler = asyncio.current_task()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        handler.cancel()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    server.viewer_demand.acquire(keys)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 2000\n\n', 'more_body': True})
+        while True:
+            if server.price_snapshot.version == seen:
+                await changes.wait(server.SSE_HEARTBEAT_SEC)
+            snapshot = server.price_snapshot
+            if snapshot.data is not None and snapshot.version != seen:
+                seen = snapshot.version
+                server.STREAM_EVENTS.inc('prices')
+                event = b'id: %d\nevent: prices\ndata: %s\n\n' % (snapshot.version, snapshot.body)
+            else:
+                server.STREAM_EVENTS.inc('heartbeat')
+                event = b': heartbeat\n\n'
+            await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+    except (asyncio.CancelledError, OSError):
+        pass
+    finally:
+        watcher.cancel()
+        server.viewer_demand.release(keys)
+
+
+# ============== Everything else: the Flask app ==============
+
+async def flask_route(scope, receive, send, headers):
+    """Run the request through server.app (WSGI) on the loop; used for the quick routes only."""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    host, port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        if name not in ('content-type', 'content-length'):
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+    started = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = response_headers
+
+    result = server.app(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    response_headers = [(n, v) for n, v in started['headers'] if n.lower() != 'content-length']
+    await respond(send, started['status'], content, response_headers, head=scope['method'] == 'HEAD')
+
+
+# ============== ASGI entry point ==============
+
+async def lifespan(receive, send):
+    global _feed, _feed_task
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            loop = asyncio.get_running_loop()
+            if server.WALLCLOCK_FEED not in ('sim', 'replay') and not server.RELAY_UPSTREAM \
+                    and not isinstance(loop, asyncio.BaseEventLoop):
+                await send({'type': 'lifespan.startup.failed', 'message': (
+                    "The IB feed can't run on a %s.%s event loop; start uvicorn with --loop asyncio"
+                    % (type(loop).__module__, type(loop).__name__)
+                )})
+                return
+            changes.bind(loop)
+            server.price_listeners.append(changes.notify)
+            if not server.RELAY_UPSTREAM:  # A relay mirrors its upstream from a thread instead
+                _feed = server.make_feed()
+                print(f"Starting {_feed.name} feed on the event loop...", flush=True)
+                _feed_task = asyncio.create_task(server.run_feed_async(_feed))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _feed_task is not None:
+                _feed_task.cancel()
+                _feed.disconnect()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    headers = request_headers(scope)
+    started = time.perf_counter()
+    if scope['method'] in ('GET', 'HEAD') and path in STATIC_PATHS:
+        observe(path, await static_file(scope, send, headers, STATIC_PATHS[path]), started)
+    elif scope['method'] == 'GET' and path == '/api/prices':
+        observe(path, await prices(scope, send, headers), started)
+    elif scope['method'] == 'GET' and path == '/api/stream':
+        observe(path, 200, started)  # Streams: timed until the first byte, like under Flask
+        await stream(scope, receive, send, headers)
+    else:
+        await flask_route(scope, receive, send, headers)  # Flask records its own metrics
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # One descriptor per display
+    except (ImportError, ValueError, OSError):
+        pass  # Windows, or not allowed; ulimit -n decides
+    print(f"Market wall clock (asyncio) on http://localhost:{server.PORT}", flush=True)
+    uvicorn.run(app, host='0.0.0.0', port=server.PORT, backlog=4096, access_log=False, lifespan='on',
+                loop='asyncio')
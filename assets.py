@@ -0,0 +1,193 @@
+"""
+Asset registry - which instruments the wall clock streams and shows.
+
+Assets live in a JSON file (assets.json), in display order:
+
+    key            asset key used everywhere else (a-z, 0-9, _; max 24 chars)
+    name           card title
+    display_symbol symbol in the price payload (what index.html matches on)
+    decimals       price decimals on the card
+    color          price colour on the card (optional)
+    contract       IB contract fields (symbol, secType, exchange, currency, multiplier, ...)
+    roll           contract month rule (see server.ROLL_RULES); omit for undated contracts
+    lookup         "search": pick the month from IB's listed contracts instead of building it
+    alias_of       show another asset's price instead of having a contract (e.g. Nasdaq -> NQ)
+    display        false = stream it but don't put a card on the wall clock (default true)
+    priority       lower goes first when market data lines run out (default 100)
+    hours          trading hours, when ticks are expected (see tradinghours.py; default always)
+    stale_after    seconds without a tick, market open, before it is resubscribed (optional)
+    source         description for /api/sources
+
+The registry is replaced as a whole on every change (readers just take
+`registry.assets` once), and every saved change bumps `version`, so other
+processes notice it with reload_if_changed().
+"""
+
+import json
+import os
+import re
+import threading
+
+from tradinghours import TradingHours
+
+KEY_PATTERN = re.compile(r'^[a-z0-9_]{1,24}$')
+DEFAULT_PRIORITY = 100
+
+
+class AssetError(ValueError):
+    """An asset definition (or change) was rejected."""
+
+
+class AssetRegistry:
+    def __init__(self, path, roll_rules=()):
+        self.path = path
+        self.roll_rules = set(roll_rules)
+        self.assets = {}   # key -> asset dict, in display order
+        self.aliases = {}  # asset key -> keys showing its price
+        self.hours = {}    # asset key -> TradingHours, for assets that have them
+        self.version = 0
+        self._stat = None
+        self._lock = threading.Lock()  # Serialises writers; readers never wait
+        self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            config = json.load(f)
+        self._stat = self._file_stat()
+        assets = {asset.get('key', ''): asset for asset in config.get('assets', [])}
+        for key, asset in assets.items():
+            self.validate(asset, {k: a for k, a in assets.items() if k != key})
+        self._install(assets, config.get('version', 1))
+
+    def reload_if_changed(self):
+        """Pick up a change saved by another process. Returns True if the registry changed."""
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return False
+        version = self.version
+        try:
+            self.load()
+        except (OSError, ValueError) as e:
+            print(f"Could not reload {self.path}: {e}", flush=True)
+            self._stat = stat  # Don't retry until it changes again
+            return False
+        return self.version != version
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _install(self, assets, version):
+        aliases = {}
+        for key, asset in assets.items():
+            if asset.get('alias_of'):
+                aliases.setdefault(asset['alias_of'], []).append(key)
+        self.aliases = aliases
+        self.hours = {key: TradingHours(asset['hours']) for key, asset in assets.items() if asset.get('hours')}
+        self.assets = assets
+        self.version = version
+
+    def validate(self, asset, assets):
+        """Raise AssetError unless `asset` fits alongside `assets` (the other assets, by key)."""
+        key = asset.get('key', '')
+        if not KEY_PATTERN.match(key):
+            raise AssetError("Asset key must be 1-24 characters of a-z, 0-9 and _: %r" % key)
+        for field in ('name', 'display_symbol'):
+            if not isinstance(asset.get(field), str) or not asset[field]:
+                raise AssetError("%s: '%s' is required" % (key, field))
+        if not isinstance(asset.get('decimals', 2), int) or not 0 <= asset.get('decimals', 2) <= 8:
+            raise AssetError("%s: 'decimals' must be 0-8" % key)
+        if not isinstance(asset.get('priority', DEFAULT_PRIORITY), int):
+            raise AssetError("%s: 'priority' must be an integer" % key)
+        stale_after = asset.get('stale_after', 1)
+        if not isinstance(stale_after, (int, float)) or stale_after <= 0:
+            raise AssetError("%s: 'stale_after' must be a positive number of seconds" % key)
+        if asset.get('hours'):
+            try:
+                TradingHours(asset['hours'])
+            except ValueError as e:
+                raise AssetError("%s: 'hours': %s" % (key, e))
+        target = asset.get('alias_of')
+        if target:
+            if asset.get('contract'):
+                raise AssetError("%s: use either 'contract' or 'alias_of', not both" % key)
+            if target not in assets or assets[target].get('alias_of'):
+                raise AssetError("%s: alias_of must name an asset with a contract" % key)
+        else:
+            contract = asset.get('contract')
+            if not isinstance(contract, dict) or not contract.get('symbol') or not contract.get('secType'):
+                raise AssetError("%s: 'contract' needs at least symbol and secType" % key)
+            if asset.get('roll', '') not in self.roll_rules | {''}:
+                raise AssetError("%s: unknown roll rule %r" % (key, asset['roll']))
+        for other_key, other in assets.items():
+            if other_key != key and other['display_symbol'] == asset['display_symbol']:
+                raise AssetError("%s: display_symbol %s is already used by %s" % (key, asset['display_symbol'], other_key))
+
+    def feed_keys(self):
+        """Keys that need a market data line, most important first.
+
+        Displayed assets come before hidden ones, then lower `priority`, then
+        display order. An asset that others alias counts as displayed if any
+        of them is.
+        """
+        assets = self.assets
+        shown = self.shown_keys(assets)
+        order = {key: i for i, key in enumerate(assets)}
+        keys = [key for key, asset in assets.items() if not asset.get('alias_of')]
+        return sorted(keys, key=lambda k: (k not in shown, assets[k].get('priority', DEFAULT_PRIORITY), order[k]))
+
+    def shown_keys(self, assets=None):
+        """Keys on a card, including assets whose price a displayed alias shows."""
+        assets = self.assets if assets is None else assets
+        shown = {key for key, asset in assets.items() if asset.get('display', True)}
+        for key, asset in assets.items():
+            if key in shown and asset.get('alias_of'):
+                shown.add(asset['alias_of'])
+        return shown
+
+    def price_key(self, key):
+        """The key whose ticks `key` shows (itself unless it is an alias)."""
+        return self.assets.get(key, {}).get('alias_of') or key
+
+    def key_for(self, symbol):
+        """Asset key for an asset key or display symbol, or None."""
+        assets = self.assets
+        if symbol in assets:
+            return symbol
+        return next((key for key, asset in assets.items() if asset['display_symbol'] == symbol), None)
+
+    # ---- changes (admin API) ----
+
+    def put(self, asset):
+        """Add or replace one asset; a new asset goes last in display order."""
+        with self._lock:
+            self.reload_if_changed()  # Another process may have saved a change since
+            assets = {key: a for key, a in self.assets.items() if key != asset.get('key')}
+            self.validate(asset, assets)
+            if asset.get('alias_of') and self.aliases.get(asset['key']):
+                raise AssetError("%s is shown by %s, so it needs a contract" % (asset['key'], ', '.join(self.aliases[asset['key']])))
+            assets = dict(self.assets)
+            assets[asset['key']] = asset
+            self._save(assets)
+
+    def remove(self, key):
+        with self._lock:
+            self.reload_if_changed()
+            if key not in self.assets:
+                raise KeyError(key)
+            if self.aliases.get(key):
+                raise AssetError("%s is shown by %s; remove those first" % (key, ', '.join(self.aliases[key])))
+            assets = {k: a for k, a in self.assets.items() if k != key}
+            self._save(assets)
+
+    def _save(self, assets):
+        version = self.version + 1
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': version, 'assets': list(assets.values())}, f, indent=1)
+        os.replace(tmp, self.path)
+        self._stat = self._file_stat()
+        self._install(assets, version)
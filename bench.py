@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the price-serving path.
+
+Starts server.py (or gunicorn, or asgi.py) against the simulated feed, then runs N
+concurrent display clients against it and prints one JSON document with
+throughput, latency percentiles, tick-to-client staleness and the server's
+CPU / RSS. Feed the JSON back in with --baseline to flag regressions.
+
+Run:  python bench.py --clients 50 --duration 30 --tick-rate 50
+      python bench.py --mode stream --clients 500 --gunicorn --workers 4
+      python bench.py --mode stream --clients 2000 --asgi
+      python bench.py --out new.json --baseline old.json
+
+Client modes:
+    poll    GET /api/prices every 10 ms with If-None-Match (what index.html's
+            polling fallback does in a browser)
+    delta   long-poll /api/prices?since=<seq>&wait=25
+    stream  /api/stream (Server-Sent Events)
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+POLL_INTERVAL = 0.010  # Same cadence as setInterval(updatePrices, 10) in index.html
+
+
+# ============== Server under test ==============
+
+def start_server(args):
+    env = dict(
+        os.environ,
+        PORT=str(args.port),
+        WALLCLOCK_FEED='sim',
+        SIM_TICK_RATE=str(args.tick_rate),
+        JOURNAL_DIR='',
+        PRICE_SNAPSHOT_PATH='',
+    )
+    if args.gunicorn:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+        cmd = [sys.executable, '-m', 'gunicorn', 'server:app', '--config', 'gunicorn.conf.py',
+               '--bind', '127.0.0.1:%d' % args.port]
+    elif args.asgi:
+        cmd = [sys.executable, 'asgi.py']
+    else:
+        cmd = [sys.executable, 'server.py']
+    return subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/prices')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not serve prices within %ds" % timeout)
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/%s/stat' % entry) as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    tree, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        tree.append(p)
+        todo.extend(children.get(p, []))
+    return tree
+
+
+def cpu_seconds(pids):
+    total = 0.0
+    for pid in pids:
+        try:
+            with open('/proc/%d/stat' % pid) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError):
+            pass
+    return total
+
+
+def rss_mb(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open('/proc/%d/status' % pid) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+    return total / 1024.0
+
+
+def sample_resources(pid, stop, samples):
+    """Peak RSS of the server process tree while the clients run."""
+    while not stop.is_set():
+        samples.append(rss_mb(process_tree(pid)))
+        stop.wait(0.5)
+
+
+# ============== Simulated displays ==============
+
+def newest_tick(payload):
+    return max((q.get('regularMarketTime') or 0 for q in payload['quoteResponse']['result']), default=0)
+
+
+def poll_client(port, until, result):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    etag = None
+    while time.time() < until:
+        started = time.perf_counter()
+        try:
+            conn.request('GET', '/api/prices', headers={'If-None-Match': etag} if etag else {})
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            result['errors'] += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            continue
+        received = time.time()
+        result['latency'].append(time.perf_counter() - started)
+        result['status'][response.status] = result['status'].get(response.status, 0) + 1
+        if response.status == 200:
+            etag = response.getheader('ETag')
+            result['staleness'].append(received - newest_tick(json.loads(body)))
+        # setInterval(…, 10) with the isFetching guard: next request no sooner than 10 ms after this one started
+        delay = POLL_INTERVAL - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def delta_client(port, until, result):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=40)
+    seq = None
+    while time.time() < until:
+        path = '/api/prices' if seq is None else '/api/prices?since=%d&wait=%d' % (seq, max(1, min(25, until - time.time())))
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            result['errors'] += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=40)
+            continue
+        received = time.time()
+        result['latency'].append(time.perf_counter() - started)
+        result['status'][response.status] = result['status'].get(response.status, 0) + 1
+        if response.status == 200:
+            payload = json.loads(body)
+            seq = payload.get('seq', seq)
+            if payload['quoteResponse']['result']:
+                result['staleness'].append(received - newest_tick(payload))
+
+
+def stream_client(port, until, result):
+    sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+    sock.sendall(b'GET /api/stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n')
+    reader = sock.makefile('rb')
+    status_line = reader.readline().split()
+    status = int(status_line[1]) if len(status_line) > 1 else 0
+    result['status'][status] = result['status'].get(status, 0) + 1
+    while reader.readline() not in (b'\r\n', b'\n', b''):
+        pass  # Headers
+    sock.settimeout(max(0.1, until - time.time()))
+    try:
+        while time.time() < until:
+            line = reader.readline()
+            if not line:
+                result['errors'] += 1
+                break
+            if line.startswith(b'data: '):
+                received = time.time()
+                result['events'] += 1
+                result['staleness'].append(received - newest_tick(json.loads(line[6:])))
+    except (OSError, ValueError):
+        pass  # Timeout at the end of the run
+    finally:
+        sock.close()
+
+
+CLIENTS = {'poll': poll_client, 'delta': delta_client, 'stream': stream_client}
+
+
+def run_clients(job):
+    """One client process: `count` display threads, results merged."""
+    mode, port, count, until = job
+    results = []
+    threads = []
+    for _ in range(count):
+        result = {'latency': [], 'staleness': [], 'status': {}, 'errors': 0, 'events': 0}
+        results.append(result)
+        threads.append(threading.Thread(target=CLIENTS[mode], args=(port, until, result), daemon=True))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(until - time.time() + 30)
+    merged = {'latency': [], 'staleness': [], 'status': {}, 'errors': 0, 'events': 0}
+    for result in results:
+        merged['latency'] += result['latency']
+        merged['staleness'] += result['staleness']
+        merged['errors'] += result['errors']
+        merged['events'] += result['events']
+        for code, n in result['status'].items():
+            merged['status'][code] = merged['status'].get(code, 0) + n
+    return merged
+
+
+# ============== Reporting ==============
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def summary_ms(values):
+    return {
+        'p50': _ms(percentile(values, 50)),
+        'p99': _ms(percentile(values, 99)),
+        'p999': _ms(percentile(values, 99.9)),
+        'max': _ms(max(values) if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Lower is better for all of these; checked against --baseline
+REGRESSION_KEYS = [
+    ('latency_ms', 'p50'), ('latency_ms', 'p99'), ('staleness_ms', 'p50'), ('staleness_ms', 'p99'),
+    ('server', 'cpu_percent'), ('server', 'rss_mb_peak'),
+]
+
+
+def compare(report, baseline, tolerance):
+    """Metrics that got worse than baseline by more than `tolerance` (fraction)."""
+    regressions = []
+    for section, key in REGRESSION_KEYS:
+        old = (baseline.get(section) or {}).get(key)
+        new = (report.get(section) or {}).get(key)
+        if old and new is not None and new > old * (1 + tolerance):
+            regressions.append({'metric': '%s.%s' % (section, key), 'baseline': old, 'current': new})
+    old_rps = baseline.get('throughput_rps')
+    if old_rps and report['throughput_rps'] < old_rps * (1 - tolerance):
+        regressions.append({'metric': 'throughput_rps', 'baseline': old_rps, 'current': report['throughput_rps']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=20, help='concurrent simulated displays')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--tick-rate', type=float, default=20, help='simulated feed ticks/sec (0 = unthrottled)')
+    parser.add_argument('--mode', choices=sorted(CLIENTS), default='poll')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--gunicorn', action='store_true', help='serve with gunicorn.conf.py instead of python server.py')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn web workers (with --gunicorn)')
+    parser.add_argument('--asgi', action='store_true', help='serve with asgi.py (asyncio) instead of python server.py')
+    parser.add_argument('--client-procs', type=int, default=min(4, os.cpu_count() or 1),
+                        help='processes the client threads are spread over')
+    parser.add_argument('--out', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--baseline', help='earlier JSON report; exit 1 if this run regressed')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression vs baseline (fraction)')
+    args = parser.parse_args()
+
+    server = start_server(args)
+    try:
+        wait_until_ready(args.port)
+        time.sleep(1)  # Let gunicorn workers / the feed settle
+
+        pids = process_tree(server.pid)
+        rss_samples = []
+        stop = threading.Event()
+        threading.Thread(target=sample_resources, args=(server.pid, stop, rss_samples), daemon=True).start()
+
+        procs = max(1, min(args.client_procs, args.clients))
+        per_proc = [args.clients // procs + (1 if i < args.clients % procs else 0) for i in range(procs)]
+        cpu_before = cpu_seconds(pids)
+        started = time.time()
+        until = started + args.duration
+        with multiprocessing.Pool(procs) as pool:
+            parts = pool.map(run_clients, [(args.mode, args.port, n, until) for n in per_proc])
+        elapsed = time.time() - started
+        cpu_used = cpu_seconds(process_tree(server.pid)) - cpu_before
+        stop.set()
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    latency, staleness, status, errors, events = [], [], {}, 0, 0
+    for part in parts:
+        latency += part['latency']
+        staleness += part['staleness']
+        errors += part['errors']
+        events += part['events']
+        for code, n in part['status'].items():
+            status[str(code)] = status.get(str(code), 0) + n
+
+    report = {
+        'timestamp': time.time(),
+        'revision': git_revision(),
+        'config': {
+            'mode': args.mode, 'clients': args.clients, 'duration_s': args.duration, 'tick_rate': args.tick_rate,
+            'server': 'gunicorn x%d' % args.workers if args.gunicorn else 'asgi.py' if args.asgi else 'server.py',
+        },
+        'requests': len(latency),
+        'events': events,
+        'errors': errors,
+        'status': status,
+        'throughput_rps': round(len(latency) / elapsed, 1),
+        'latency_ms': summary_ms(latency),
+        'staleness_ms': summary_ms(staleness),
+        'server': {
+            'cpu_percent': round(100.0 * cpu_used / elapsed, 1),
+            'rss_mb_peak': round(max(rss_samples), 1) if rss_samples else None,
+        },
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            report['baseline_config'] = baseline.get('config')  # Not like-for-like; read with care
+        report['regressions'] = compare(report, baseline, args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Viewer demand - which asset keys connected clients are looking at.
+
+Open streams hold a reference on their keys; one-off requests (polls) just
+touch theirs. A key stays wanted while it has references and for `grace`
+seconds after the last one goes away or the last touch, so a page reload or
+a brief gap between polls doesn't cost a resubscription.
+
+snapshot() gives {key: wanted-until epoch}. Web workers write theirs to a
+file next to the price board and the feed process merges them with
+wanted_keys(); a worker that dies simply stops renewing its keys.
+"""
+
+import json
+import threading
+import time
+
+
+class Demand:
+    def __init__(self, grace=300.0):
+        self.grace = grace
+        self._refs = {}   # key -> open references
+        self._until = {}  # key -> epoch it stays wanted until, once unreferenced
+        self._lock = threading.Lock()
+        self.streams = 0  # Open acquire()s
+
+    def acquire(self, keys):
+        with self._lock:
+            self.streams += 1
+            for key in keys:
+                self._refs[key] = self._refs.get(key, 0) + 1
+
+    def release(self, keys):
+        until = time.time() + self.grace
+        with self._lock:
+            self.streams -= 1
+            for key in keys:
+                refs = self._refs.get(key, 0) - 1
+                if refs > 0:
+                    self._refs[key] = refs
+                else:
+                    self._refs.pop(key, None)
+                    self._until[key] = max(self._until.get(key, 0), until)
+
+    def touch(self, keys):
+        until = time.time() + self.grace
+        with self._lock:
+            for key in keys:
+                if self._until.get(key, 0) < until:
+                    self._until[key] = until
+
+    def snapshot(self, now=None):
+        """{key: epoch it is wanted until}; referenced keys count as wanted for another grace period."""
+        now = now or time.time()
+        with self._lock:
+            for key in [key for key, until in self._until.items() if until <= now]:
+                del self._until[key]
+            wanted = dict(self._until)
+            for key in self._refs:
+                wanted[key] = now + self.grace
+        return wanted
+
+
+def wanted_keys(snapshots, now=None):
+    """Keys wanted by any of `snapshots` (from Demand.snapshot) at `now`."""
+    now = now or time.time()
+    return {key for snapshot in snapshots for key, until in snapshot.items() if until > now}
+
+
+def read_snapshot(path):
+    """A snapshot written by another process, or {} if it's gone or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,447 @@
+"""
+Price feeds for the wall clock.
+
+A feed produces ticks for asset keys (see assets.py). server.run_feed
+drives any feed the same way - connect(), poll() while connected, disconnect()
+- and applies the retry, staleness and notification logic on top, so the
+whole serving path can be exercised without IB Gateway:
+
+    Feed           - base class / interface
+    SimulatedFeed  - deterministic random walk at a fixed tick rate
+    ReplayFeed     - recorded tick journal (tickstore.TickJournal) at 1x, 10x or unthrottled
+    FailoverFeed   - primary + hot standby feeds, switching to whichever keeps ticking
+
+The IB Gateway implementation (IBFeed) lives in server.py next to its contract setup.
+"""
+
+import asyncio
+import glob
+import os
+import random
+import time
+from collections import namedtuple
+
+from tickstore import JournalReader
+
+# What a feed hands to on_tick(key, tick); same fields server.ingest_ticker reads from an ib_insync Ticker
+# (volume: cumulative traded volume, 0 if unknown)
+Tick = namedtuple('Tick', ['bid', 'ask', 'last', 'close', 'volume'], defaults=[0.0])
+
+
+class FeedUnavailable(Exception):
+    """The feed's source can't be reached right now (retry later)."""
+
+
+class Feed:
+    """Source of ticks for asset keys.
+
+    connect(on_tick) starts delivery; poll(timeout) delivers ticks for up to
+    `timeout` seconds by calling on_tick(key, tick); disconnect() stops.
+    set_keys(keys) changes which keys it should deliver, connected or not;
+    `subscribed` are the ones it actually can (all of them unless the source
+    refuses some) and `expected` the ones that should be ticking (subscribed,
+    or due a line whose subscription failed); resubscribe(key) re-requests one
+    key that has gone quiet.
+
+    connect_async() / poll_async() do the same on an event loop shared with
+    other work (asgi.py): by default poll() is called without blocking to
+    deliver whatever is due, and the loop runs in between.
+    """
+    name = 'feed'
+    poll_step = 0.005      # Seconds between non-blocking polls in poll_async()
+    unthrottled = False    # Delivers as fast as it can: poll_async() gives it short bursts instead
+
+    def __init__(self):
+        self.on_tick = None
+        self.keys = []
+        self._connected = False
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def connect(self, on_tick):
+        self.on_tick = on_tick
+        self._connected = True
+
+    def set_keys(self, keys):
+        self.keys = list(keys)
+
+    @property
+    def subscribed(self):
+        return self.keys
+
+    @property
+    def expected(self):
+        return self.keys
+
+    def resubscribe(self, key):
+        pass  # Nothing to re-request unless the source has subscriptions
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+
+    async def connect_async(self, on_tick):
+        self.connect(on_tick)
+
+    async def poll_async(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.poll(self.poll_step if self.unthrottled else 0)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(0 if self.unthrottled else min(self.poll_step, remaining))
+
+    def disconnect(self):
+        self._connected = False
+
+
+# Rough starting levels for the simulated feed; other keys start at 100
+SIM_START_PRICES = {
+    'silver': 31.5,
+    'gold': 2650.0,
+    'sp500': 5900.0,
+    'sp500_futures': 5920.0,
+    'nasdaq_futures': 21000.0,
+    'nifty_futures': 24000.0,
+}
+
+
+class SimulatedFeed(Feed):
+    """Geometric random walk over `keys` at `tick_rate` ticks/sec in total (0 = as fast as possible).
+
+    The same seed always produces the same sequence of ticks.
+    """
+    name = 'Simulated'
+
+    def __init__(self, keys, tick_rate=20.0, seed=1, volatility=0.0002, spread=0.0001):
+        super().__init__()
+        self.keys = list(keys)
+        self.tick_rate = tick_rate
+        self.seed = seed
+        self.volatility = volatility
+        self.spread = spread
+        self._rng = None
+        self._prices = {}
+        self._close = {}
+        self._volume = {}  # Cumulative, bigger moves trading more
+        self._next_tick = 0.0
+
+    @property
+    def unthrottled(self):
+        return not self.tick_rate
+
+    def connect(self, on_tick):
+        super().connect(on_tick)
+        self._rng = random.Random(self.seed)
+        self._prices = {key: SIM_START_PRICES.get(key, 100.0) for key in self.keys}
+        self._close = dict(self._prices)
+        self._volume = dict.fromkeys(self.keys, 0.0)
+        self._next_tick = time.monotonic()
+        for key in self.keys:
+            self._emit(key)
+
+    def set_keys(self, keys):
+        added = [key for key in keys if key not in self.keys]
+        super().set_keys(keys)
+        if not self.connected:
+            return
+        for key in added:
+            if key not in self._prices:
+                self._prices[key] = self._close[key] = SIM_START_PRICES.get(key, 100.0)
+                self._volume[key] = 0.0
+            self._emit(key)  # Like a fresh subscription, starts with the current price
+
+    def poll(self, timeout):
+        if not self.keys:
+            return super().poll(timeout)
+        deadline = time.monotonic() + timeout
+        interval = 1.0 / self.tick_rate if self.tick_rate else 0.0
+        while True:
+            now = time.monotonic()
+            if interval:
+                if self._next_tick > deadline:
+                    time.sleep(max(0.0, deadline - now))
+                    return
+                if self._next_tick > now:
+                    time.sleep(self._next_tick - now)
+                # Don't try to catch up on more than a second of missed ticks
+                self._next_tick = max(self._next_tick, now - 1.0) + interval
+            elif now >= deadline:
+                return
+            key = self._rng.choice(self.keys)
+            move = self._rng.gauss(0.0, self.volatility)
+            self._prices[key] *= 1.0 + move
+            self._volume[key] += 1 + int(abs(move) / self.volatility * 5)
+            self._emit(key)
+
+    def _emit(self, key):
+        price = self._prices[key]
+        half_spread = price * self.spread / 2
+        self.on_tick(key, Tick(price - half_spread, price + half_spread, price, self._close[key], self._volume[key]))
+
+
+class ReplayFeed(Feed):
+    """Replays journal files in order, paced by their timestamps.
+
+    `path` is a journal file, a directory of them, or a glob. `speed` 1 = real
+    time, 10 = ten times faster, 0 = unthrottled. With `loop` the recording
+    starts over when it ends; otherwise the feed goes quiet (and the staleness
+    watchdog eventually reconnects it, which starts the replay again).
+    """
+    name = 'Replay'
+
+    def __init__(self, path, speed=1.0, loop=True):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self._records = None
+        self._pending = None
+        self._origin = None  # (journal ts, monotonic time) the pacing is measured from
+        self._last_ts = 0.0
+
+    @property
+    def unthrottled(self):
+        return not self.speed
+
+    def journal_files(self):
+        pattern = os.path.join(self.path, 'ticks-*.bin') if os.path.isdir(self.path) else self.path
+        return sorted(glob.glob(pattern))
+
+    def connect(self, on_tick):
+        files = self.journal_files()
+        if not files:
+            raise FeedUnavailable("No tick journal at %s" % self.path)
+        super().connect(on_tick)
+        self._records = self._iter_records(files)
+        self._pending = None
+        self._origin = None
+        self._last_ts = 0.0
+
+    def _iter_records(self, files):
+        while True:
+            for path in files:
+                reader = JournalReader(path)
+                yield from reader
+                reader.close()
+            if not self.loop:
+                return
+
+    def poll(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._pending is None:
+                self._pending = next(self._records, None)
+                if self._pending is None:
+                    time.sleep(max(0.0, deadline - time.monotonic()))  # Recording finished
+                    return
+            ts, key, price, bid, ask, last, close = self._pending
+            now = time.monotonic()
+            if self.speed:
+                if self._origin is None or ts < self._last_ts:
+                    self._origin = (ts, now)  # First tick, or the recording looped
+                due = self._origin[1] + (ts - self._origin[0]) / self.speed
+                if due > deadline:
+                    time.sleep(max(0.0, deadline - now))
+                    return
+                if due > now:
+                    time.sleep(due - now)
+            elif now >= deadline:
+                return
+            self._pending = None
+            self._last_ts = ts
+            self.on_tick(key, Tick(bid, ask, last, close))
+
+
+class FailoverFeed(Feed):
+    """Runs several feeds at once and passes on the ticks of one of them.
+
+    Every member stays connected and subscribed. Ticks from the active member
+    go to on_tick; the others' are only remembered (latest tick per key). A
+    member is healthy while connected, unless another member went on ticking
+    for `failover_after` seconds after its last tick: from the other's first
+    tick after it to the other's latest. So neither a quiet market nor two
+    sessions delivering the same tick a few ms apart looks like a failure. When the active member stops being healthy
+    the first healthy one takes over. The first member is preferred and gets
+    its place back after `failback_after` seconds of being healthy again.
+    On every switch, the new member's latest ticks are replayed so each key
+    is current straight away - but only those that arrived after the last
+    tick passed on for that key, so a member that fell behind doesn't put
+    older prices back. The receiver drops repeated prices
+    (server.ingest_ticker), so a switch doesn't publish duplicates.
+    Disconnected members are reconnected every `retry_interval` seconds.
+    """
+
+    def __init__(self, feeds, failover_after=1.0, failback_after=5.0, retry_interval=10.0,
+                 check_interval=0.1, on_switch=None):
+        super().__init__()
+        self.feeds = list(feeds)
+        self.name = ' + '.join(feed.name for feed in self.feeds)
+        self.failover_after = failover_after
+        self.failback_after = failback_after
+        self.retry_interval = retry_interval
+        self.check_interval = check_interval
+        self.on_switch = on_switch  # on_switch(member name)
+        self.active = 0
+        count = len(self.feeds)
+        self._last_tick = [0.0] * count
+        self._behind_since = [None] * count  # First tick of another member after this one's last
+        self._healthy_since = [None] * count
+        self._latest = [{} for _ in range(count)]  # per member: key -> (received, tick)
+        self._delivered = {}  # key -> when the tick last passed on for it was received
+        self._retry_at = [0.0] * count
+
+    @property
+    def connected(self):
+        return any(feed.connected for feed in self.feeds)
+
+    def connect(self, on_tick):
+        super().connect(on_tick)
+        for index in range(len(self.feeds)):
+            self._connect_member(index)
+        self._pick_connected()
+
+    async def connect_async(self, on_tick):
+        super().connect(on_tick)
+        for index in range(len(self.feeds)):
+            await self._connect_member_async(index)
+        self._pick_connected()
+
+    def _pick_connected(self):
+        if not self.connected:
+            raise FeedUnavailable("No %s feed reachable" % self.name)
+        if not self.feeds[self.active].connected:
+            self._switch(next(i for i, feed in enumerate(self.feeds) if feed.connected), 'failover')
+
+    def _connect_member(self, index):
+        try:
+            self.feeds[index].connect(self._reset_member(index))
+        except Exception as e:
+            self._member_failed(index, e)
+
+    async def _connect_member_async(self, index):
+        try:
+            await self.feeds[index].connect_async(self._reset_member(index))
+        except Exception as e:
+            self._member_failed(index, e)
+
+    def _reset_member(self, index):
+        """Forget what member `index` delivered so far; returns its on_tick."""
+        self._last_tick[index] = 0.0
+        self._behind_since[index] = None
+        self._healthy_since[index] = None
+        self._latest[index] = {}
+        return lambda key, tick: self._on_member_tick(index, key, tick)
+
+    def _member_failed(self, index, e):
+        feed = self.feeds[index]
+        print(f"{feed.name} unavailable: {e}", flush=True)
+        feed.disconnect()
+        self._retry_at[index] = time.monotonic() + self.retry_interval
+
+    def set_keys(self, keys):
+        super().set_keys(keys)
+        for index, feed in enumerate(self.feeds):
+            feed.set_keys(self.keys)
+            self._latest[index] = {key: latest for key, latest in self._latest[index].items() if key in self.keys}
+
+    @property
+    def subscribed(self):
+        return self.feeds[self.active].subscribed
+
+    @property
+    def expected(self):
+        return self.feeds[self.active].expected
+
+    def resubscribe(self, key):
+        for feed in self.feeds:
+            if feed.connected:
+                feed.resubscribe(key)
+
+    def _on_member_tick(self, index, key, tick):
+        now = self._last_tick[index] = time.monotonic()
+        self._behind_since[index] = None
+        for other in range(len(self.feeds)):
+            if other != index and self._behind_since[other] is None:
+                self._behind_since[other] = now
+        self._latest[index][key] = (now, tick)
+        if index == self.active:
+            self._delivered[key] = now
+            self.on_tick(key, tick)
+
+    def _switch(self, index, reason):
+        previous, self.active = self.feeds[self.active], index
+        print(f"Feed {reason}: {previous.name} -> {self.feeds[index].name}", flush=True)
+        if self.on_switch:
+            self.on_switch(self.feeds[index].name)
+        for key, (received, tick) in list(self._latest[index].items()):
+            if received > self._delivered.get(key, 0.0):
+                self._delivered[key] = received
+                self.on_tick(key, tick)
+
+    def _reconnects_due(self):
+        """Disconnected members whose retry time has come (already disconnected, ready to connect)."""
+        now = time.monotonic()
+        due = []
+        for index, feed in enumerate(self.feeds):
+            if not feed.connected and now >= self._retry_at[index]:
+                print(f"Reconnecting {feed.name}...", flush=True)
+                feed.disconnect()
+                due.append(index)
+        return due
+
+    def _check(self):
+        now = time.monotonic()
+        newest = max(self._last_tick)
+        for index, feed in enumerate(self.feeds):
+            if not feed.connected:
+                self._healthy_since[index] = None
+            elif self._last_tick[index] and (self._behind_since[index] is None
+                                             or newest - self._behind_since[index] < self.failover_after):
+                if self._healthy_since[index] is None:
+                    self._healthy_since[index] = now
+            else:
+                self._healthy_since[index] = None
+
+        if self._healthy_since[self.active] is None:
+            healthy = [i for i, since in enumerate(self._healthy_since) if since is not None]
+            if healthy:
+                self._switch(healthy[0], 'failover')
+        elif self.active != 0 and self._healthy_since[0] is not None \
+                and now - self._healthy_since[0] >= self.failback_after:
+            self._switch(0, 'failback')
+
+    def poll(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            live = [feed for feed in self.feeds if feed.connected]
+            for feed in live:
+                feed.poll(self.check_interval / len(live))
+            if not live:
+                time.sleep(self.check_interval)
+            for index in self._reconnects_due():
+                self._connect_member(index)
+            self._check()
+            if time.monotonic() >= deadline:
+                return
+
+    async def poll_async(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            live = [feed for feed in self.feeds if feed.connected]
+            for feed in live:
+                await feed.poll_async(self.check_interval / len(live))
+            if not live:
+                await asyncio.sleep(self.check_interval)
+            for index in self._reconnects_due():
+                await self._connect_member_async(index)
+            self._check()
+            if time.monotonic() >= deadline:
+                return
+
+    def disconnect(self):
+        for feed in self.feeds:
+            feed.disconnect()
+        super().disconnect()
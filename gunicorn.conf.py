@@ -0,0 +1,68 @@
+"""
+Gunicorn settings: one IB feed process + any number of HTTP workers.
+
+The master starts `server.py` once with WALLCLOCK_ROLE=feed; it holds the only
+IB connection (IB_CLIENT_ID) and publishes into a shared-memory price board.
+Workers run with WALLCLOCK_ROLE=web and read prices from that board, so
+--workers can be raised to use every core.
+
+Run: gunicorn server:app --config gunicorn.conf.py --bind 0.0.0.0:8080
+"""
+
+import glob
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_shm = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = 32  # Each /api/stream or long-poll client holds a thread
+
+_feed = {'process': None, 'stopping': False}
+
+
+def _run_feed():
+    """Keep exactly one feed process alive for the lifetime of the master."""
+    env = dict(os.environ, WALLCLOCK_ROLE='feed')
+    while not _feed['stopping']:
+        _feed['process'] = subprocess.Popen([sys.executable, os.path.join(_here, 'server.py')], env=env)
+        code = _feed['process'].wait()
+        if not _feed['stopping']:
+            print(f"Feed process exited ({code}), restarting in 5 seconds...", flush=True)
+            time.sleep(5)
+
+
+def on_starting(server):
+    os.environ.setdefault('PRICE_BOARD_PATH', os.path.join(_shm, 'wallclock-%d.board' % os.getpid()))
+    threading.Thread(target=_run_feed, daemon=True).start()
+    # Workers are forked after this and inherit the role
+    os.environ['WALLCLOCK_ROLE'] = 'web'
+
+
+def worker_exit(server, worker):
+    # Its viewers are gone; don't keep their symbols subscribed for the grace period
+    try:
+        os.remove('%s.demand-%d' % (os.environ['PRICE_BOARD_PATH'], worker.pid))
+    except (KeyError, OSError):
+        pass
+
+
+def on_exit(server):
+    _feed['stopping'] = True
+    if _feed['process'] is not None:
+        _feed['process'].terminate()
+    board = os.environ.get('PRICE_BOARD_PATH')
+    if not board:
+        return
+    for path in [board, board + '.metrics', board + '.freshness'] + glob.glob(board + '.demand-*'):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,74 +1,54 @@
 #!/usr/bin/env python3
 """
 Weekly IBKR login reminder. Run via cron once per week (e.g. Sunday 9am).
-Sends a single notification if prices appear stale, so you only need to log in when reminded.
+Sends a single notification if the feed is down or a symbol stopped ticking while its market
+is open (per-symbol state in /api/status), so you only need to log in when reminded.
 Set NOTIFY_* env vars (same as server.py) for Telegram and/or email.
 """
+import json
 import os
 import sys
 import time
 import urllib.request
-import urllib.parse
 
-# Same env vars as server.py
-NOTIFY_EMAIL = os.environ.get('NOTIFY_EMAIL', '')
-SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
-SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
-SMTP_USER = os.environ.get('SMTP_USER', '')
-SMTP_PASS = os.environ.get('SMTP_PASS', '')
-TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
-TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # notify.py
+from notify import Notifier, channels_from_env
+
+# Same env vars as server.py (channels: TELEGRAM_* and NOTIFY_EMAIL/SMTP_*, see notify.py)
 NOTIFY_NOVNC_URL = os.environ.get('NOTIFY_NOVNC_URL', 'https://safronliveprices.duckdns.org/novnc/vnc.html')
 STATUS_URL = os.environ.get('WALLCLOCK_STATUS_URL', 'http://127.0.0.1:8080/api/status')
-STALE_SEC = 30 * 60  # Consider "stale" if no update in 30 minutes
-
-
-def send(msg):
-    if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-        try:
-            url = "https://api.telegram.org/bot%s/sendMessage?chat_id=%s&text=%s" % (
-                TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, urllib.parse.quote(msg)
-            )
-            urllib.request.urlopen(url, timeout=10)
-            print("Sent Telegram", flush=True)
-        except Exception as e:
-            print("Telegram failed:", e, flush=True)
-    if NOTIFY_EMAIL and SMTP_USER and SMTP_PASS:
-        try:
-            import smtplib
-            from email.mime.text import MIMEText
-            m = MIMEText(msg)
-            m['Subject'] = "Weekly: IBKR login reminder - Wall Clock"
-            m['From'] = SMTP_USER
-            m['To'] = NOTIFY_EMAIL
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-                s.starttls()
-                s.login(SMTP_USER, SMTP_PASS)
-                s.sendmail(SMTP_USER, NOTIFY_EMAIL, m.as_string())
-            print("Sent email", flush=True)
-        except Exception as e:
-            print("Email failed:", e, flush=True)
+STALE_SEC = 30 * 60  # Without per-symbol status: consider "stale" if no update in 30 minutes
+SEND_TIMEOUT_SEC = 10 * 60  # Keep retrying a failed channel for up to this long before exiting
 
 
 def main():
     try:
         r = urllib.request.urlopen(STATUS_URL, timeout=5)
-        data = r.read().decode()
-        import json
-        j = json.loads(data)
+        j = json.loads(r.read().decode())
         ib_connected = j.get('ib_connected', False)
-        last_update = j.get('last_update', 0)
-        now = time.time()
-        if ib_connected and last_update and (now - last_update) < STALE_SEC:
-            # All good, no reminder
-            return 0
+        symbols = j.get('symbols')
+        if symbols is not None:
+            # Per-symbol freshness: only a symbol whose market is open and that isn't ticking counts
+            stale = sorted(key for key, info in symbols.items() if info.get('state') == 'stale')
+            if ib_connected and not stale:
+                return 0
+            if stale:
+                print("Stale with the market open:", ', '.join(stale), flush=True)
+        else:
+            # Older server (or a relay): fall back to the time of the last update of any price
+            last_update = j.get('last_update', 0)
+            if ib_connected and last_update and (time.time() - last_update) < STALE_SEC:
+                return 0
     except Exception as e:
         print("Status check failed:", e, flush=True)
     msg = (
         "Weekly reminder: IBKR login may be required if prices have stopped. "
         "Log in via noVNC (no need to open IBKR website): %s"
     ) % NOTIFY_NOVNC_URL
-    send(msg)
+    notifier = Notifier(channels_from_env(), retries=4, backoff=15)
+    notifier.notify('weekly', "Weekly: IBKR login reminder - Wall Clock", msg)
+    if not notifier.flush(SEND_TIMEOUT_SEC):
+        print("Gave up waiting for notifications to send", flush=True)
     return 0
 
 
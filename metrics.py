@@ -0,0 +1,131 @@
+"""
+Minimal Prometheus-style metrics (text exposition format 0.0.4), no dependencies.
+
+Counters and histograms are plain dicts keyed by label values; recording is
+a dict lookup plus a bisect under one small lock, so it is cheap enough for
+the tick path. Gauges are callbacks evaluated at scrape time.
+
+Families with no samples yet render nothing, so the output of two processes
+that each fill a different subset of the same registry can be concatenated.
+Labels passed to render() go on every sample, e.g. worker="<pid>" where
+several processes fill the same families.
+"""
+
+import threading
+from bisect import bisect_left
+
+# Seconds; tuned for sub-millisecond ingest stages up to multi-second requests
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=''):
+    parts = ['%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{%s}' % ','.join(parts) if parts else ''
+
+
+def _num(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, extra=''):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items:
+            return []
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        for values, count in items:
+            lines.append('%s%s %s' % (self.name, _labels(self.label_names, values, extra), _num(count)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self, extra=''):
+        with self._lock:
+            items = sorted((values, list(series)) for values, series in self._series.items())
+        if not items:
+            return []
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = 'le="%s"' % (bound if bound == '+Inf' else repr(float(bound)))
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _labels(self.label_names, values, ','.join(filter(None, (extra, le)))), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _labels(self.label_names, values, extra), repr(series[-1])))
+            lines.append('%s_count%s %d' % (self.name, _labels(self.label_names, values, extra), cumulative))
+        return lines
+
+
+class Gauge:
+    """Value read from `fn()` at scrape time: a number, {label values tuple: number}, or None to skip."""
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name, self.help, self.fn, self.label_names = name, help, fn, tuple(labels)
+
+    def render(self, extra=''):
+        value = self.fn()
+        if value is None or value == {}:
+            return []
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s gauge' % self.name]
+        if isinstance(value, dict):
+            for values, v in sorted(value.items()):
+                lines.append('%s%s %s' % (self.name, _labels(self.label_names, values, extra), _num(v)))
+        else:
+            lines.append('%s%s %s' % (self.name, _labels((), (), extra), _num(value)))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=()):
+        return self.register(Gauge(name, help, fn, labels))
+
+    def render(self, **labels):
+        extra = _labels(labels, labels.values())[1:-1]
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(extra))
+        return '\n'.join(lines) + '\n'
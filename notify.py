@@ -0,0 +1,148 @@
+"""
+Alerts (Telegram, email) sent from a background thread.
+
+Notifier.notify() only queues the message and returns straight away, so the
+feed thread never waits on a mail server or api.telegram.org. A sender thread
+delivers it to every configured channel, retrying each channel that fails
+with exponential backoff. Messages carry a key: while one with the same key is
+still being delivered, or was accepted less than `throttle` seconds ago,
+another one is dropped.
+
+Channels come from the same environment variables server.py has always read
+(channels_from_env); anything with a name and send(subject, text) will do.
+"""
+
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+
+class TelegramChannel:
+    name = 'telegram'
+
+    def __init__(self, token, chat_id, timeout=10):
+        self.token = token
+        self.chat_id = chat_id
+        self.timeout = timeout
+
+    def send(self, subject, text):
+        url = "https://api.telegram.org/bot%s/sendMessage?chat_id=%s&text=%s" % (
+            self.token, self.chat_id, urllib.parse.quote(text)
+        )
+        urllib.request.urlopen(url, timeout=self.timeout).close()
+
+
+class EmailChannel:
+    name = 'email'
+
+    def __init__(self, host, port, user, password, to, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.to = to
+        self.timeout = timeout
+
+    def send(self, subject, text):
+        import smtplib
+        from email.mime.text import MIMEText
+        m = MIMEText(text)
+        m['Subject'] = subject
+        m['From'] = self.user
+        m['To'] = self.to
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as s:
+            s.starttls()
+            s.login(self.user, self.password)
+            s.sendmail(self.user, self.to, m.as_string())
+
+
+def channels_from_env(environ=os.environ):
+    """The channels configured by TELEGRAM_BOT_TOKEN/TELEGRAM_CHAT_ID and NOTIFY_EMAIL/SMTP_*."""
+    channels = []
+    if environ.get('TELEGRAM_BOT_TOKEN') and environ.get('TELEGRAM_CHAT_ID'):
+        channels.append(TelegramChannel(environ['TELEGRAM_BOT_TOKEN'], environ['TELEGRAM_CHAT_ID']))
+    if environ.get('NOTIFY_EMAIL') and environ.get('SMTP_USER') and environ.get('SMTP_PASS'):
+        channels.append(EmailChannel(
+            environ.get('SMTP_HOST', 'smtp.gmail.com'), int(environ.get('SMTP_PORT', '587')),
+            environ['SMTP_USER'], environ['SMTP_PASS'], environ['NOTIFY_EMAIL'],
+        ))
+    return channels
+
+
+class Notifier:
+    def __init__(self, channels, throttle=0.0, retries=5, backoff=30.0, max_backoff=1800.0, max_queued=100):
+        self.channels = list(channels)
+        self.throttle = throttle        # Default seconds before the same key may be sent again
+        self.retries = retries          # Further attempts per channel after the first one fails
+        self.backoff = backoff          # First retry after this long, doubling up to max_backoff
+        self.max_backoff = max_backoff
+        self._queue = queue.Queue(max_queued)
+        self._accepted = {}             # key -> when a message with it was last accepted
+        self._active = {}               # key -> deliveries (channels) still to finish
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._thread = None
+        self._order = itertools.count()  # Tie-breaker for the retry heap
+
+    def notify(self, key, subject, text, throttle=None):
+        """Queue `text` for every channel. Never blocks; False if it was dropped (throttled or queue full)."""
+        if not self.channels:
+            return False
+        throttle = self.throttle if throttle is None else throttle
+        now = time.time()
+        with self._lock:
+            if self._active.get(key) or now - self._accepted.get(key, float('-inf')) < throttle:
+                return False
+            try:
+                self._queue.put_nowait((key, subject, text))
+            except queue.Full:
+                print(f"Notification queue full, dropped: {subject}", flush=True)
+                return False
+            self._accepted[key] = now
+            self._active[key] = len(self.channels)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+                self._thread.start()
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until everything queued has been delivered or given up on; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not any(self._active.values()), timeout)
+
+    def _run(self):
+        retries = []  # heap of (due, order, attempt, channel, message)
+        while True:
+            wait = max(0.0, retries[0][0] - time.monotonic()) if retries else None
+            try:
+                message = self._queue.get(timeout=wait)
+                for channel in self.channels:
+                    self._deliver(retries, channel, message, 0)
+            except queue.Empty:
+                pass
+            while retries and retries[0][0] <= time.monotonic():
+                _, _, attempt, channel, message = heapq.heappop(retries)
+                self._deliver(retries, channel, message, attempt)
+
+    def _deliver(self, retries, channel, message, attempt):
+        key, subject, text = message
+        try:
+            channel.send(subject, text)
+            print(f"Sent {channel.name} notification: {subject}", flush=True)
+        except Exception as e:
+            if attempt < self.retries:
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                print(f"{channel.name} notify failed ({e}), retrying in {delay:.0f}s", flush=True)
+                heapq.heappush(retries, (time.monotonic() + delay, next(self._order), attempt + 1, channel, message))
+                return
+            print(f"{channel.name} notify failed, giving up: {e}", flush=True)
+        with self._idle:
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+                self._idle.notify_all()
@@ -0,0 +1,188 @@
+"""
+Shared-memory price board - lets one feed process serve many HTTP workers.
+
+The feed process owns the board and is its only writer. Gunicorn workers map
+the same file read-only and copy out whatever changed; no locks or sockets are
+involved on either side.
+
+Layout (little endian, fixed width):
+
+    header  magic, layout, boot_id, version, count, flags   (HEADER_SIZE bytes)
+    slot*   seq, key, price, change, change_pct, bid, ask, ts, item_seq, item_flags,
+            then the session statistics (analytics.FIELDS; NaN = none)
+
+Each slot is a seqlock: the writer bumps `seq` to an odd value, writes the
+fields, then bumps it to the next even value. A reader retries while `seq` is
+odd or changed underneath it, so it never returns a torn record. It gives up
+after READ_RETRIES tries (a writer that died mid-update leaves `seq` odd for
+good) and skips the slot until its next pass.
+"""
+
+import math
+import mmap
+import os
+import struct
+
+from analytics import FIELDS as STATS_FIELDS
+
+MAGIC = b'WCPB'
+LAYOUT = 4
+BOARD_SLOTS = 1024
+READ_RETRIES = 1000  # Tries at a slot that is being written before skipping it this pass
+
+HEADER = struct.Struct('<4sIQQQQ')   # magic, layout, boot_id, version, count, flags
+HEADER_SIZE = 64
+SLOT = struct.Struct('<Q24sddddddQQ' + 'd' * len(STATS_FIELDS))  # seq, key, price, ..., item_flags, stats
+SLOT_SIZE = SLOT.size
+KEY_SIZE = 24
+
+# Header field offsets (each 8-byte aligned so single fields update atomically)
+_VERSION_OFFSET = 16
+_COUNT_OFFSET = 24
+_FLAGS_OFFSET = 32
+
+FLAG_CONNECTED = 1   # header flags
+ITEM_STALE = 1       # item flags: last-known price restored from disk, not live
+ITEM_REMOVED = 2     #   asset gone from the registry; readers drop the key
+
+
+class SlotBusy(Exception):
+    """A slot stayed mid-write (odd seq) or kept changing for READ_RETRIES tries."""
+
+
+def board_size(slots=BOARD_SLOTS):
+    return HEADER_SIZE + slots * SLOT_SIZE
+
+
+class PriceBoard:
+    """Fixed-size price table in a memory-mapped file."""
+
+    def __init__(self, path, create=False, slots=BOARD_SLOTS, boot_id=0):
+        self.path = path
+        self.writable = create
+        if create:
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.truncate(board_size(slots))
+            os.replace(tmp, path)
+        with open(path, 'r+b' if create else 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if create else mmap.ACCESS_READ)
+        if create:
+            HEADER.pack_into(self._mm, 0, MAGIC, LAYOUT, boot_id, 0, 0, 0)
+        magic, layout, self.boot_id, _, _, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or layout != LAYOUT:
+            raise ValueError("%s is not a price board (layout %d)" % (path, LAYOUT))
+        self.slots = (len(self._mm) - HEADER_SIZE) // SLOT_SIZE
+        self._slot_of = {}  # key -> slot index (writer side)
+
+    # ---- writer (feed process) ----
+
+    def write(self, key, data):
+        """Store one symbol; `data` is a live_prices entry."""
+        self.write_many({key: data})
+
+    def write_many(self, changed):
+        """Store several symbols ({key: data}) as one version.
+
+        The header version only moves once every slot is written, so a reader
+        that sees the new version finds the whole batch (they share one seq).
+        """
+        for key, data in changed.items():
+            self._write_slot(key, data)
+        if changed:
+            struct.pack_into('<Q', self._mm, _VERSION_OFFSET, max(data.get('seq', 0) for data in changed.values()))
+
+    def _write_slot(self, key, data):
+        index = self._slot_of.get(key)
+        if index is None:
+            index = len(self._slot_of)
+            if index >= self.slots:
+                raise ValueError("Price board full (%d slots)" % self.slots)
+            self._slot_of[key] = index
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        seq = struct.unpack_from('<Q', self._mm, offset)[0]
+        struct.pack_into('<Q', self._mm, offset, seq + 1)  # odd: write in progress
+        SLOT.pack_into(
+            self._mm, offset, seq + 1, key.encode('utf-8')[:KEY_SIZE],
+            data.get('price', 0), data.get('change', 0), data.get('change_pct', 0),
+            data.get('bid', 0), data.get('ask', 0), data.get('ts', 0), data.get('seq', 0),
+            (ITEM_STALE if data.get('stale') else 0) | (ITEM_REMOVED if data.get('removed') else 0),
+            *[math.nan if data.get(field) is None else data[field] for field in STATS_FIELDS]
+        )
+        struct.pack_into('<Q', self._mm, offset, seq + 2)  # even: record complete
+        if index >= self.count:
+            struct.pack_into('<Q', self._mm, _COUNT_OFFSET, index + 1)
+
+    def set_connected(self, connected):
+        flags = self.flags
+        flags = (flags | FLAG_CONNECTED) if connected else (flags & ~FLAG_CONNECTED)
+        struct.pack_into('<Q', self._mm, _FLAGS_OFFSET, flags)
+
+    # ---- readers (HTTP workers) ----
+
+    @property
+    def version(self):
+        return struct.unpack_from('<Q', self._mm, _VERSION_OFFSET)[0]
+
+    @property
+    def count(self):
+        return struct.unpack_from('<Q', self._mm, _COUNT_OFFSET)[0]
+
+    @property
+    def flags(self):
+        return struct.unpack_from('<Q', self._mm, _FLAGS_OFFSET)[0]
+
+    @property
+    def connected(self):
+        return bool(self.flags & FLAG_CONNECTED)
+
+    def read_slot(self, index):
+        """Consistent (key, data) for one slot, or None if it is empty. Raises SlotBusy."""
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        for _ in range(READ_RETRIES):
+            seq, key, price, change, change_pct, bid, ask, ts, item_seq, item_flags, *stats = SLOT.unpack_from(self._mm, offset)
+            if seq & 1:
+                continue  # Writer is mid-update
+            if struct.unpack_from('<Q', self._mm, offset)[0] != seq:
+                continue  # Overwritten while we copied it
+            if not seq:
+                return None
+            key = key.rstrip(b'\0').decode('utf-8')
+            data = {
+                'price': price, 'change': change, 'change_pct': change_pct,
+                'bid': bid, 'ask': ask, 'ts': ts, 'seq': item_seq,
+            }
+            for field, value in zip(STATS_FIELDS, stats):
+                if value == value:  # Not NaN
+                    data[field] = value
+            if item_flags & ITEM_STALE:
+                data['stale'] = True
+            if item_flags & ITEM_REMOVED:
+                data['removed'] = True
+            return key, data
+        raise SlotBusy("Price board slot %d is still being written" % index)
+
+    def read_since(self, since):
+        """All symbols whose item seq is newer than `since`: ({key: data}, complete).
+
+        Read `version` first and continue from that next time, not from the
+        newest item seq here: a batch still being written has its seq on some
+        slots already, and the rest would be skipped. A slot that stays busy
+        (SlotBusy) is left out and `complete` is False; the write in progress
+        belongs to a later version, so continuing from `version` still gets it
+        once it's done (a writer that died never finishes it).
+        """
+        changed = {}
+        complete = True
+        for index in range(min(self.count, self.slots)):
+            try:
+                entry = self.read_slot(index)
+            except SlotBusy:
+                complete = False
+                continue
+            if entry and entry[1]['seq'] > since:
+                changed[entry[0]] = entry[1]
+        return changed, complete
+
+    def close(self):
+        self._mm.close()
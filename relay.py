@@ -0,0 +1,58 @@
+"""
+Upstream wall-clock server, for relay mode (RELAY_UPSTREAM in server.py).
+
+A relay mirrors another wall-clock server - the one with the IB session, or
+another relay - instead of connecting to IB itself:
+
+    snapshot()      GET /api/prices: the full payload, its version and the
+                    upstream's boot id (from the ETag)
+    events(since)   GET /api/stream resumed from `since` (Last-Event-ID):
+                    (version, payload) for every change after it
+
+Every stream event carries the complete payload, so any event brings the
+relay fully up to date; nothing has to be replayed after a gap.
+"""
+
+import json
+import urllib.request
+
+
+class UpstreamError(Exception):
+    """The upstream answered, but not with prices (e.g. still waiting for its feed)."""
+
+
+class Upstream:
+    def __init__(self, url, timeout=5.0, stream_timeout=40.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout  # No bytes for this long (not even a heartbeat) = dead
+
+    def snapshot(self):
+        """(boot id, version, payload) from the upstream's /api/prices."""
+        request = urllib.request.Request(self.url + '/api/prices', headers={'Accept': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.load(response)
+            tag = (response.headers.get('ETag') or '').strip('"')
+        if 'quoteResponse' not in payload:
+            raise UpstreamError(payload.get('error') or 'no prices')
+        boot, _, version = tag.rpartition('-')
+        return boot, int(version) if version.isdigit() else payload.get('seq', 0), payload
+
+    def events(self, since):
+        """Yield (version, payload) from the upstream's /api/stream, starting after version `since`."""
+        request = urllib.request.Request(self.url + '/api/stream', headers={
+            'Accept': 'text/event-stream',
+            'Last-Event-ID': str(since),
+        })
+        with urllib.request.urlopen(request, timeout=self.stream_timeout) as response:
+            event_id, data = None, []
+            for raw in response:
+                line = raw.decode('utf-8').rstrip('\r\n')
+                if line.startswith('id:'):
+                    event_id = line[3:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].lstrip())
+                elif not line:
+                    if data and event_id is not None and event_id.isdigit():
+                        yield int(event_id), json.loads('\n'.join(data))
+                    event_id, data = None, []
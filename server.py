@@ -6,87 +6,267 @@ Then open: http://localhost:8080
 Requires: IB Gateway running and logged in
 """
 
-from flask import Flask, jsonify, send_file
+from flask import Flask, Response, g, jsonify, request, send_file
+from contextlib import contextmanager
+from types import MappingProxyType
+from array import array
+import glob
+import gzip
+import hmac
 import json
 import os
 import threading
 import time
 
+from analytics import WINDOWS, SymbolStats, utc_day
+from assets import AssetError, AssetRegistry
+from demand import Demand, read_snapshot, wanted_keys
+from feeds import FailoverFeed, Feed, FeedUnavailable, ReplayFeed, SimulatedFeed
+from metrics import Registry
+from notify import Notifier, channels_from_env
+from priceboard import PriceBoard
+from relay import Upstream, UpstreamError
+from staticfiles import StaticFiles, etag, pick_encoding
+from tickstore import BAR_SECONDS, JournalReader, TickJournal, TickRing, journal_path
+
 PORT = int(os.environ.get('PORT', 8080))
 app = Flask(__name__, static_folder=os.path.dirname(os.path.abspath(__file__)))
 
 # Flag to track if background updater is running
 _updater_started = False
 
-# Global cache for prices
-price_cache = {
-    'data': None,
-    'last_update': 0,
-    'lock': threading.Lock()
-}
+# Price state is copy-on-write: one writer per process (the feed thread, board follower
+# or relay thread) builds a new immutable value and swaps the module-level reference.
+# Readers take the reference once and get a consistent view of every symbol, no locks.
+
+
+class PriceSnapshot:
+    """Immutable, pre-encoded view of the prices served by /api/prices and /api/stream
+    (data is None until the first prices arrive).
+
+    The gzip body is only compressed when a client first asks for it: the feed
+    publishes far more versions than anyone downloads (and a gunicorn feed
+    process serves none at all).
+    """
+    __slots__ = ('version', 'data', 'body', 'etag', 'last_update', '_gzip_body')
+
+    def __init__(self, version, data, body, etag, last_update):
+        self.version = version
+        self.data = data
+        self.body = body
+        self.etag = etag
+        self.last_update = last_update
+        self._gzip_body = None
+
+    @property
+    def gzip_body(self):
+        if self._gzip_body is None:  # Two threads may both compress it once; same result
+            self._gzip_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzip_body
+
+
+def price_etag(snapshot, coding=''):
+    """Quoted strong ETag of one encoding of the snapshot's body (like staticfiles.etag)."""
+    return '"%s-%s"' % (snapshot.etag, coding) if coding else '"%s"' % snapshot.etag
+
+price_snapshot = PriceSnapshot(0, None, b'', '', 0)
+_quote_cache = {}     # key -> (asset, data, quote, quote JSON); entries are reused while both are the same objects
+_unpublished = []     # (key, data, stored, received) stored by publish_price, not in price_snapshot yet
+_batch_depth = 0      # Inside price_batch(): publish when it ends
+
+# Distinguishes ETags across restarts (versions start again at 1)
+_BOOT_ID = '%x' % int(time.time())
+
+
+class PriceChanges:
+    """Wakes threads waiting for the next price version.
+
+    Take event() before looking at price_snapshot, then wait on it: the writer
+    swaps the snapshot first and sets the event after, so a change in between
+    can't be missed. Each version gets a fresh Event, so waiters never share a
+    lock with the writer or with readers.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def event(self):
+        return self._event
+
+    def notify(self):
+        event, self._event = self._event, threading.Event()
+        event.set()
+
 
-# Live prices storage
-live_prices = {}
+price_changed = PriceChanges()  # Used by /api/stream and long-polls
+price_listeners = []  # Also called (no arguments) on every new version; asgi.py wakes its waiters this way
+SSE_HEARTBEAT_SEC = 15
+LONG_POLL_MAX_SEC = 30  # Upper bound for /api/prices?since=...&wait=...
+
+# Latest data per asset key (read-only mapping of never-mutated dicts; see store_prices)
+live_prices = MappingProxyType({})
 ib_connected = False
+feed_freshness = {}  # Per-symbol freshness from the feed watchdog (see symbol_freshness)
+
+# ============== Price feed ==============
+# ib (default): IB Gateway | sim: synthetic random walk | replay: recorded tick journal
+WALLCLOCK_FEED = os.environ.get('WALLCLOCK_FEED', 'ib')
+SIM_TICK_RATE = float(os.environ.get('SIM_TICK_RATE', '20'))  # Ticks/sec across all symbols, 0 = unthrottled
+SIM_SEED = int(os.environ.get('SIM_SEED', '1'))
+REPLAY_PATH = os.environ.get('REPLAY_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal'))
+REPLAY_SPEED = float(os.environ.get('REPLAY_SPEED', '1'))    # 1 = real time, 10 = 10x, 0 = unthrottled
+# Relay mode: mirror another wall-clock server (the one with the IB session, or another
+# relay) instead of running a feed, e.g. RELAY_UPSTREAM=http://primary.office:8080
+RELAY_UPSTREAM = os.environ.get('RELAY_UPSTREAM', '')
+RELAY_RETRY_SEC = 2
+relay_state = {'connected': False, 'seq': 0, 'lag_seconds': None, 'last_event': 0}  # seq: the upstream's
+
+# Recent ticks per asset key for /api/history (bounded: HISTORY_TICKS per symbol)
+HISTORY_TICKS = int(os.environ.get('HISTORY_TICKS', '20000'))
+tick_history = {}
+
+# Session open/high/low, VWAP and rolling returns/volatility per asset key (see analytics.py),
+# updated on every tick in the feed process and published with the price
+symbol_stats = {}
+STATS_QUOTE_FIELDS = {  # live_prices field -> quote field (Yahoo's names where it has one)
+    'open': 'regularMarketOpen', 'high': 'regularMarketDayHigh', 'low': 'regularMarketDayLow',
+    'vwap': 'vwap', 'return_1m': 'return1m', 'return_5m': 'return5m',
+    'volatility_1m': 'volatility1m', 'volatility_5m': 'volatility5m',
+}
+
+# Append-only on-disk journal of every accepted tick (set JOURNAL_DIR= to disable).
+# Off by default for sim/replay feeds so test runs don't mix into the real journal, and for
+# relays (the upstream keeps it).
+JOURNAL_DIR = os.environ.get(
+    'JOURNAL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal')
+    if WALLCLOCK_FEED == 'ib' and not RELAY_UPSTREAM else ''
+)
+JOURNAL_KEEP_DAYS = int(os.environ.get('JOURNAL_KEEP_DAYS', '7'))
+tick_journal = None
+
+# ============== Process role ==============
+# ''     single process: IB thread and HTTP together (python server.py)
+# 'feed' IB connection only, publishing into the shared price board (started by gunicorn.conf.py)
+# 'web'  HTTP worker mirroring the price board; any number of these can run
+# 'async' single process on one asyncio event loop: HTTP and the feed together (python asgi.py)
+WALLCLOCK_ROLE = os.environ.get('WALLCLOCK_ROLE', '')
+PRICE_BOARD_PATH = os.environ.get('PRICE_BOARD_PATH', '')
+BOARD_POLL_SEC = 0.005  # How often a web worker checks the board for a new version
+price_board = None      # Writable board, feed role only
+
+if WALLCLOCK_ROLE == 'feed':
+    price_board = PriceBoard(PRICE_BOARD_PATH, create=True, boot_id=int(time.time()))
+    _BOOT_ID = '%x' % price_board.boot_id
+
+# Last-known prices, saved periodically so a restart can show them straight away (marked stale).
+# Set PRICE_SNAPSHOT_PATH= to disable (off by default for sim/replay feeds and relays).
+PRICE_SNAPSHOT_PATH = os.environ.get(
+    'PRICE_SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prices-snapshot.json')
+    if WALLCLOCK_FEED == 'ib' and not RELAY_UPSTREAM else ''
+)
+SNAPSHOT_SAVE_SEC = 5
+
+# Only the process that talks to IB writes the journal
+if JOURNAL_DIR and WALLCLOCK_ROLE != 'web':
+    tick_journal = TickJournal(JOURNAL_DIR, keep_days=JOURNAL_KEEP_DAYS)
+
+# ============== Metrics (served at /metrics) ==============
+# Each tick is timed from IB delivery (socket read, ib_insync's ticker.time) through
+# our handler, into live_prices, and into the published cache snapshot. The feed
+# process has no HTTP server, so it writes its metrics next to the price board every
+# METRICS_DUMP_SEC and web workers append that file to their own /metrics output.
+METRICS_DUMP_SEC = 1
+metrics = Registry()
+TICK_LATENCY = metrics.histogram(
+    'wallclock_tick_latency_seconds',
+    'Tick latency per stage: delivery (IB socket -> handler), store (-> live_prices), '
+    'publish (-> cache snapshot), total (first timestamp -> cache snapshot)',
+    ['symbol', 'stage'])
+TICKS = metrics.counter('wallclock_ticks_total', 'Accepted (price-changing) ticks', ['symbol'])
+FEED_HANDLER = metrics.histogram('wallclock_feed_handler_seconds', 'Time spent handling one tick inside the feed event loop')
+FEED_BUSY = metrics.counter(
+    'wallclock_feed_busy_seconds_total', 'Time the feed thread spent ingesting ticks and publishing snapshots (not waiting)')
+FEED_RESUBSCRIBES = metrics.counter(
+    'wallclock_feed_resubscribes_total', 'Symbols resubscribed after going quiet with their market open', ['symbol'])
+FEED_SWITCHES = metrics.counter('wallclock_feed_switches_total', 'Failover / failback switches, by the session switched to', ['to'])
+BOARD_LAG = metrics.histogram(
+    'wallclock_board_lag_seconds', 'Feed process ingest -> web worker cache snapshot, via the price board', ['symbol'])
+RELAY_LAG = metrics.histogram(
+    'wallclock_relay_lag_seconds',
+    'Relay mode: published by the upstream -> published here, for stream events (assumes synced clocks)', ['symbol'])
+RELAY_RESYNCS = metrics.counter('wallclock_relay_resyncs_total', 'Relay mode: full resyncs from the upstream snapshot')
+HTTP_REQUESTS = metrics.counter('wallclock_http_requests_total', 'HTTP requests', ['route', 'status'])
+HTTP_DURATION = metrics.histogram(
+    'wallclock_http_request_duration_seconds', 'Time to build the response (streams: until the first byte)', ['route'])
+PRICE_RESPONSES = metrics.counter(
+    'wallclock_price_responses_total', '/api/prices outcomes: full, not_modified, delta, unavailable', ['result'])
+STREAM_EVENTS = metrics.counter('wallclock_stream_events_total', '/api/stream events sent', ['event'])
+if WALLCLOCK_ROLE != 'feed':
+    metrics.gauge('wallclock_feed_connected', 'Whether the price feed is connected', lambda: ib_connected)
+    metrics.gauge('wallclock_price_version', 'Current price cache version', lambda: price_snapshot.version)
+    metrics.gauge('wallclock_viewer_streams', 'Open /api/stream connections', lambda: viewer_demand.streams)
+    metrics.gauge(
+        'wallclock_price_age_seconds', 'Seconds since each symbol last changed',
+        lambda: {(key,): time.time() - data['ts'] for key, data in live_prices.items() if data.get('ts')},
+        ['symbol'])
 
 # ============== IBKR Configuration ==============
 IB_HOST = '127.0.0.1'
 IB_PORTS = [4001, 4002, 7496, 7497]  # Common IB Gateway ports
 IB_CLIENT_ID = 1
+# Optional hot-standby session, kept subscribed and switched to if the primary stops ticking.
+# Set IB_STANDBY_CLIENT_ID (e.g. 2) to enable; IB_STANDBY_HOST / IB_STANDBY_PORTS for a second gateway.
+IB_STANDBY_CLIENT_ID = os.environ.get('IB_STANDBY_CLIENT_ID', '')
+IB_STANDBY_HOST = os.environ.get('IB_STANDBY_HOST', IB_HOST)
+IB_STANDBY_PORTS = [int(p) for p in os.environ.get('IB_STANDBY_PORTS', '').split(',') if p] or IB_PORTS
+FAILOVER_AFTER_SEC = 0.5   # Standby has ticks the primary hasn't had for this long = switch
+FAILBACK_AFTER_SEC = 5.0   # Primary keeping up again for this long = switch back
+IB_PROBE_TIMEOUT = 3.0            # Per-port probe (all ports are probed at once)
+IB_PREFERRED_PROBE_TIMEOUT = 0.5  # Last good port, tried first on its own
+# Qualified contracts and the last good port, so a reconnect skips the lookups (IB_CACHE_PATH= to disable)
+IB_CACHE_PATH = os.environ.get(
+    'IB_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ib-cache.json')
+)
+IB_CACHE_HOURS = float(os.environ.get('IB_CACHE_HOURS', '24'))
+_ib_cache = None
+ROLL_CALENDAR_DAYS = 120          # How far ahead contract rolls are planned
+ROLL_RETRY_SEC = 3600             # Next contract not found yet: try again this much later
+WATCHDOG_INTERVAL = 1.0     # Seconds between staleness / periodic-reconnect checks
+STALE_THRESHOLD_SEC = 5 * 60  # No valid tick from any symbol whose market is open for this long = force reconnect
+SYMBOL_STALE_SEC = 120        # One symbol, market open, no tick for this long = resubscribe it (per asset: stale_after)
 
 # ============== Re-auth notification (no need to check noVNC/IBKR until you get this) ==============
 NOTIFY_THROTTLE_HOURS = float(os.environ.get('NOTIFY_THROTTLE_HOURS', '24'))  # 24 = daily, 168 = weekly
 NOTIFY_THROTTLE_SEC = int(NOTIFY_THROTTLE_HOURS * 3600)
 FAILURES_BEFORE_NOTIFY = 3       # After this many connection failures, send notification
-_last_reauth_notification_time = 0
 _consecutive_failures = 0
 
-# Optional: set in environment to get automatic alerts when login is required
-NOTIFY_EMAIL = os.environ.get('NOTIFY_EMAIL', '')           # e.g. you@example.com
-SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
-SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
-SMTP_USER = os.environ.get('SMTP_USER', '')
-SMTP_PASS = os.environ.get('SMTP_PASS', '')
-TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
-TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', '')
+# Optional: set TELEGRAM_BOT_TOKEN + TELEGRAM_CHAT_ID and/or NOTIFY_EMAIL + SMTP_HOST/PORT/USER/PASS
+# in the environment to get automatic alerts when login is required (see notify.py).
+# Sent from a background thread; a channel that is down is retried for about 15 minutes.
 NOTIFY_NOVNC_URL = os.environ.get('NOTIFY_NOVNC_URL', 'https://safronliveprices.duckdns.org/novnc/vnc.html')
+notifier = Notifier(channels_from_env(), throttle=NOTIFY_THROTTLE_SEC)
 
-# Asset configuration
-ASSETS = {
-    'silver': {
-        'name': 'Silver',
-        'display_symbol': 'XAG/USD',
-    },
-    'gold': {
-        'name': 'Gold',
-        'display_symbol': 'XAU/USD',
-    },
-    'sp500': {
-        'name': 'S&P 500',
-        'display_symbol': '^GSPC',
-    },
-    'nasdaq': {
-        'name': 'Nasdaq',
-        'display_symbol': '^IXIC',
-    },
-    'sp500_futures': {
-        'name': 'S&P 500 Futures',
-        'display_symbol': 'ES',
-    },
-    'nasdaq_futures': {
-        'name': 'Nasdaq Futures',
-        'display_symbol': 'NQ',
-    },
-    'nifty_futures': {
-        'name': 'Nifty Futures',
-        'display_symbol': 'NIFTY',
-    }
-}
+# Asset registry: instruments, contracts, roll rules and card settings (see assets.py).
+# Changed at runtime through /api/admin/assets when ADMIN_TOKEN is set.
+ASSETS_PATH = os.environ.get('ASSETS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets.json'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+IB_MAX_LINES = int(os.environ.get('IB_MAX_LINES', '95'))  # Market data lines per IB session (keep below the account's allowance)
 
-def get_front_month():
+# Demand-driven subscriptions: only assets some client is showing get a market data
+# line, until DEMAND_GRACE_SEC after their last viewer left (SUBSCRIBE_ON_DEMAND=0 streams all).
+# Assets with "display": false have no card to be shown on and are always streamed.
+SUBSCRIBE_ON_DEMAND = os.environ.get('SUBSCRIBE_ON_DEMAND', '1') == '1'
+DEMAND_GRACE_SEC = float(os.environ.get('DEMAND_GRACE_SEC', '300'))
+DEMAND_WRITE_SEC = 1  # How often a web worker tells the feed process what its clients show
+viewer_demand = Demand(DEMAND_GRACE_SEC)
+
+def get_front_month(now=None):
     """Get the front month contract date (YYYYMM) for quarterly futures (ES, NQ)."""
     from datetime import datetime
-    now = datetime.now()
+    now = now or datetime.now()
     month, year = now.month, now.year
     quarterly_months = [3, 6, 9, 12]
     for qm in quarterly_months:
@@ -98,10 +278,10 @@ def get_front_month():
     return f"{year+1}03"
 
 
-def get_gc_contract_month():
+def get_gc_contract_month(now=None):
     """GC (Gold) current continuous contract: Apr, Jun, Aug, Oct, Dec. April in Jan–Apr, then auto-roll."""
     from datetime import datetime
-    now = datetime.now()
+    now = now or datetime.now()
     y, m = now.year, now.month
     months = [4, 6, 8, 10, 12]  # continuous cycle
     for mo in months:
@@ -110,10 +290,10 @@ def get_gc_contract_month():
     return f"{y}04"  # Jan–Mar: current year April
 
 
-def get_si_contract_month():
+def get_si_contract_month(now=None):
     """SI (Silver) contract months: Mar, May, Sep, Dec. Auto-roll to next when current expires."""
     from datetime import datetime
-    now = datetime.now()
+    now = now or datetime.now()
     y, m = now.year, now.month
     months = [3, 5, 9, 12]  # SI cycle
     for mo in months:
@@ -122,338 +302,1301 @@ def get_si_contract_month():
     return f"{y+1}{months[0]:02d}"
 
 
-def get_nifty_front_month():
+def get_nifty_front_month(now=None):
     """Get front month for Nifty (monthly expiry, last Thursday of month). Returns YYYYMM."""
     from datetime import datetime
-    now = datetime.now()
+    now = now or datetime.now()
     year, month = now.year, now.month
     # Current month is front until last Thursday has passed
     return f"{year}{month:02d}"
 
 
+# Contract month rules an asset's "roll" can name
+ROLL_RULES = {
+    'quarterly': get_front_month,    # Mar/Jun/Sep/Dec, next one from the 16th (ES, NQ)
+    'gc': get_gc_contract_month,     # Apr/Jun/Aug/Oct/Dec
+    'si': get_si_contract_month,     # Mar/May/Sep/Dec
+    'monthly': get_nifty_front_month,
+}
+
+asset_registry = AssetRegistry(ASSETS_PATH, ROLL_RULES)
+
+
 def send_reauth_notification():
-    """Send one notification that IBKR re-auth is required (throttled to once per NOTIFY_THROTTLE_SEC)."""
-    global _last_reauth_notification_time
-    now = time.time()
-    if now - _last_reauth_notification_time < NOTIFY_THROTTLE_SEC:
-        return
-    _last_reauth_notification_time = now
+    """Queue one notification that IBKR re-auth is required (throttled to once per NOTIFY_THROTTLE_SEC)."""
     msg = (
         "IBKR re-authentication required. "
         "Prices have stopped. Log in via noVNC (no need to open IBKR website): %s"
     ) % NOTIFY_NOVNC_URL
-    # Telegram
-    if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-        try:
-            import urllib.request
-            import urllib.parse
-            url = "https://api.telegram.org/bot%s/sendMessage?chat_id=%s&text=%s" % (
-                TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, urllib.parse.quote(msg)
-            )
-            urllib.request.urlopen(url, timeout=10)
-            print("Sent Telegram re-auth notification", flush=True)
-        except Exception as e:
-            print("Telegram notify failed: %s" % e, flush=True)
-    # Email
-    if NOTIFY_EMAIL and SMTP_USER and SMTP_PASS:
-        try:
-            import smtplib
-            from email.mime.text import MIMEText
-            m = MIMEText(msg)
-            m['Subject'] = "IBKR login required - Wall Clock"
-            m['From'] = SMTP_USER
-            m['To'] = NOTIFY_EMAIL
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-                s.starttls()
-                s.login(SMTP_USER, SMTP_PASS)
-                s.sendmail(SMTP_USER, NOTIFY_EMAIL, m.as_string())
-            print("Sent email re-auth notification", flush=True)
-        except Exception as e:
-            print("Email notify failed: %s" % e, flush=True)
+    notifier.notify('reauth', "IBKR login required - Wall Clock", msg)
 
-def update_price_cache_from_live():
-    """Update the Flask cache from live prices"""
-    global live_prices, price_cache
+def update_price_cache_from_live(version=None):
+    """Publish a new price_snapshot built from live_prices (as `version`, default: the next one).
+
+    live_prices entries and registry assets are never changed in place, so a
+    quote (and its JSON) is only built again when one of them was replaced:
+    a tick costs one quote plus joining the rest, not encoding every symbol.
+    """
+    global price_snapshot, _quote_cache
     
+    prices = live_prices
     results = []
-    for key, asset in ASSETS.items():
-        if key in live_prices:
-            data = live_prices[key]
-            results.append({
-                'symbol': asset['display_symbol'],
-                'regularMarketPrice': data.get('price', 0),
-                'regularMarketChange': data.get('change', 0),
-                'regularMarketChangePercent': data.get('change_pct', 0),
-            })
+    fragments = []
+    cache = {}
+    stale = False
+    for key, asset in asset_registry.assets.items():
+        data = prices.get(asset.get('alias_of') or key)  # e.g. the Nasdaq row shows NQ
+        if data:
+            cached = _quote_cache.get(key)
+            if cached is None or cached[0] is not asset or cached[1] is not data:
+                quote = {
+                    'symbol': asset['display_symbol'],
+                    'regularMarketPrice': data.get('price', 0),
+                    'regularMarketChange': data.get('change', 0),
+                    'regularMarketChangePercent': data.get('change_pct', 0),
+                    'regularMarketTime': data.get('ts', 0),
+                    'seq': data.get('seq', 0),
+                }
+                for field, name in STATS_QUOTE_FIELDS.items():
+                    if data.get(field) is not None:
+                        quote[name] = data[field]
+                if data.get('stale'):
+                    quote['stale'] = True
+                cached = (asset, data, quote, json.dumps(quote, separators=(',', ':')).encode('utf-8'))
+            cache[key] = cached
+            results.append(cached[2])
+            fragments.append(cached[3])
+            stale = stale or data.get('stale', False)
+    _quote_cache = cache
     
     if results:
-        with price_cache['lock']:
-            price_cache['data'] = {'quoteResponse': {'result': results}}
-            price_cache['last_update'] = time.time()
+        if version is None:
+            version = price_snapshot.version + 1
+        published = time.time()
+        data = {'quoteResponse': {'result': results}, 'seq': version, 'assets': asset_registry.version,
+                'published': round(published, 3)}  # For relays downstream, see run_relay
+        if stale:
+            data['stale'] = True
+        body = b'{"quoteResponse":{"result":[%s]},"seq":%d,"assets":%d,"published":%s%s}' % (
+            b','.join(fragments), version, asset_registry.version, json.dumps(data['published']).encode('ascii'),
+            b',"stale":true' if stale else b''
+        )
+        price_snapshot = PriceSnapshot(version, data, body, '%s-%d' % (_BOOT_ID, version), published)
+        price_changed.notify()
+        for listener in price_listeners:
+            listener()
+
+def select_price(ticker):
+    """Prefer live: bid/ask mid (best for futures), then last, then close."""
+    price = None
+    if ticker.bid and ticker.bid > 0 and ticker.ask and ticker.ask > 0:
+        price = (ticker.bid + ticker.ask) / 2
+    if (price is None or price <= 0) and ticker.last and ticker.last > 0:
+        price = ticker.last
+    if (price is None or price <= 0) and ticker.close and ticker.close > 0:
+        price = ticker.close
+    return price
 
-def run_ibkr_connection():
-    """Run IBKR connection using ib_insync for real-time prices"""
-    global live_prices, ib_connected, _consecutive_failures
+def ingest_ticker(key, ticker):
+    """Store an updated ticker in live_prices. Returns True if it carried a valid price."""
+    price = select_price(ticker)
+    if not price or price <= 0:
+        return False
     
-    import asyncio
-    import socket
+    prev_close = ticker.close if ticker.close and ticker.close > 0 else price
+    change = price - prev_close
+    change_pct = (change / prev_close * 100) if prev_close else 0
     
-    # Create new event loop for this thread
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    now = time.time()
+    stats = symbol_stats.get(key)
+    if stats is None:
+        stats = symbol_stats[key] = SymbolStats()
+    hours = asset_registry.hours.get(key)
+    stats.session = hours.session if hours else utc_day
+    stats.update(now, price, getattr(ticker, 'volume', 0) or 0)  # Cumulative volume, when the feed has it
+    # IB tickers carry the day's open/high/low, including what traded while we weren't subscribed
+    stats.session_range(getattr(ticker, 'open', None), getattr(ticker, 'high', None), getattr(ticker, 'low', None))
     
-    while True:
-        ib = None
-        try:
-            # Try multiple ports to find IB Gateway
-            connected_port = None
-            for port in IB_PORTS:
-                print(f"Checking IB Gateway at {IB_HOST}:{port}...", flush=True)
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(3)
-                result = sock.connect_ex((IB_HOST, port))
-                sock.close()
-                
-                if result == 0:
-                    connected_port = port
-                    print(f"IB Gateway found on port {port}!", flush=True)
-                    break
-            
-            if not connected_port:
-                _consecutive_failures += 1
-                if _consecutive_failures >= FAILURES_BEFORE_NOTIFY:
-                    send_reauth_notification()
-                print(f"IB Gateway not reachable. Waiting 10 seconds...", flush=True)
-                time.sleep(10)
-                continue
-            
-            from ib_insync import IB, Index, Future, Forex
-            
-            ib = IB()
-            print(f"Connecting to IB Gateway on port {connected_port}...", flush=True)
-            ib.connect(IB_HOST, connected_port, clientId=IB_CLIENT_ID, timeout=20)
-            ib_connected = True
-            _consecutive_failures = 0  # Reset so next time we need re-auth we can notify again
-            print("Connected to Interactive Brokers!", flush=True)
-            
-            # Front month for ES/NQ; GC and SI use their own cycles
-            front_month = get_front_month()
-            print(f"ES/NQ front month: {front_month}", flush=True)
-            print(f"GC (Gold) contract: {get_gc_contract_month()}, SI (Silver) contract: {get_si_contract_month()}", flush=True)
-            
-            # Create contracts (Contract used for GC/SI explicit month)
-            from ib_insync import Contract
-            contracts = {}
-            
-            # Gold: GC (COMEX), 100 oz. Current continuous = Apr, Jun, Aug, Oct, Dec
-            gc_month = get_gc_contract_month()
-            gold_contract = Contract()
-            gold_contract.symbol = 'GC'
-            gold_contract.secType = 'FUT'
-            gold_contract.exchange = 'COMEX'
-            gold_contract.currency = 'USD'
-            gold_contract.lastTradeDateOrContractMonth = gc_month
-            gold_contract.multiplier = '100'
-            contracts['gold'] = gold_contract
-            print(f"GC requesting month: {gc_month} (April continuous)", flush=True)
-            
-            # Silver: SI (COMEX), 5000 oz. Contract months Mar/May/Sep/Dec
-            si_month = get_si_contract_month()
-            silver_contract = Contract()
-            silver_contract.symbol = 'SI'
-            silver_contract.secType = 'FUT'
-            silver_contract.exchange = 'COMEX'
-            silver_contract.currency = 'USD'
-            silver_contract.lastTradeDateOrContractMonth = si_month
-            silver_contract.multiplier = '5000'
-            contracts['silver'] = silver_contract
-            print(f"SI requesting month: {si_month}", flush=True)
-            
-            # Indices
-            contracts['sp500'] = Index('SPX', 'CBOE', 'USD')
-            # Nasdaq: NQ futures (reliable live); we'll copy NQ price to 'nasdaq' in the loop
-            contracts['nasdaq_futures'] = Future('NQ', front_month, 'CME')
-            contracts['sp500_futures'] = Future('ES', front_month, 'CME')
-            
-            # GIFT Nifty - strict front month (Feb now), auto-roll to next month after expiry
-            nifty_front = get_nifty_front_month()  # e.g. "202602" in February
-            print(f"Nifty front month (target): {nifty_front}", flush=True)
-            nifty_found = False
+    old = live_prices.get(key, {})
+    if abs(price - old.get('price', 0)) > 0.0001 or old.get('stale'):
+        bid = ticker.bid if ticker.bid and ticker.bid > 0 else 0.0
+        ask = ticker.ask if ticker.ask and ticker.ask > 0 else 0.0
+        # ib_insync stamps tickers with the time their data came off the socket
+        received = getattr(ticker, 'time', None)
+        publish_price(key, {
+            'price': price, 'change': change, 'change_pct': change_pct,
+            'bid': bid, 'ask': ask, 'ts': now, **stats.fields(),
+        }, received=received.timestamp() if received else None)
+        if tick_journal is not None:
+            last = ticker.last if ticker.last and ticker.last > 0 else 0.0
+            tick_journal.record(now, key, price, bid, ask, last, prev_close)
+    return True
+
+def publish_price(key, data, received=None):
+    """Write one symbol into live_prices, tagged with the cache version it first appears in.
+
+    Published straight away, or at the end of the enclosing price_batch().
+    `received` is when the feed got the tick off the wire, if it knows (epoch seconds).
+    """
+    # Single writer (the feed thread), so the next version number is known up front
+    data['seq'] = price_snapshot.version + 1
+    store_price(key, data)
+    _unpublished.append((key, data, time.time(), received))
+    if not _batch_depth:
+        flush_prices()
+
+@contextmanager
+def price_batch():
+    """Publish every price stored inside as one version when the block ends
+    (e.g. all tickers from one read of the IB socket), instead of one each."""
+    global _batch_depth
+    _batch_depth += 1
+    try:
+        yield
+    finally:
+        _batch_depth -= 1
+        if not _batch_depth:
+            start = time.perf_counter()
+            flush_prices()
+            FEED_BUSY.inc(amount=time.perf_counter() - start)
+
+def flush_prices():
+    """Publish what publish_price stored since the last snapshot."""
+    if not _unpublished:
+        return
+    update_price_cache_from_live()
+    published = price_snapshot.last_update
+    for key, data, stored, received in _unpublished:
+        TICKS.inc(key)
+        TICK_LATENCY.observe(stored - data['ts'], key, 'store')
+        TICK_LATENCY.observe(published - stored, key, 'publish')
+        if received:
+            TICK_LATENCY.observe(data['ts'] - received, key, 'delivery')
+        TICK_LATENCY.observe(published - (received or data['ts']), key, 'total')
+    _unpublished.clear()
+
+def store_price(key, data):
+    store_prices({key: data})
+
+def store_prices(changed):
+    """Put new live_prices entries ({key: data}) in place in one swap, and on the shared board
+    when we are the feed process. The data dicts must not be changed afterwards."""
+    set_live_prices(dict(live_prices, **changed))
+    if price_board is not None:
+        price_board.write_many(changed)
+    for key, data in changed.items():
+        ring = tick_history.get(key)
+        if ring is None:
+            ring = tick_history[key] = TickRing(HISTORY_TICKS)
+        ring.append(data.get('ts') or time.time(), data['price'], data.get('bid', 0.0), data.get('ask', 0.0))
+
+def set_live_prices(prices):
+    """Swap in `prices` (a dict nobody else holds) as live_prices."""
+    global live_prices
+    live_prices = MappingProxyType(prices)
+
+def republish_prices(stale=()):
+    """Publish the current prices as a new version after the asset registry or the streamed keys changed.
+
+    Prices of removed assets are dropped (and marked removed on the board) and
+    those of keys in `stale` (no longer streamed) are marked stale; all get the
+    new seq so web workers and delta clients pick up the change straight away.
+    """
+    assets = asset_registry.assets
+    version = price_snapshot.version + 1
+    prices = {}
+    removed = {}
+    for key, data in live_prices.items():
+        if key not in assets:
+            removed[key] = dict(data, seq=version, removed=True)
+            continue
+        data = prices[key] = dict(data, seq=version)
+        if key in stale:
+            data['stale'] = True
+    if price_board is not None:
+        price_board.write_many(dict(prices, **removed))
+    set_live_prices(prices)
+    update_price_cache_from_live(version)
+
+def set_ib_connected(connected):
+    global ib_connected
+    ib_connected = connected
+    if price_board is not None:
+        price_board.set_connected(connected)
+
+def wanted_contract_months(now=None):
+    """Contract month each streamed asset should be on at `now` (default: now; '' = not a dated contract)."""
+    return {
+        key: ROLL_RULES[asset['roll']](now) if asset.get('roll') else ''
+        for key, asset in asset_registry.assets.items() if asset.get('contract')
+    }
+
+def contract_roll_calendar(now=None, days=ROLL_CALENDAR_DAYS):
+    """Upcoming rolls: {key: (local datetime the wanted month changes, new month)}.
+
+    The month rules are date based, so walking midnights forward finds the
+    first change for each key; keys that don't roll within `days` are left out.
+    """
+    from datetime import datetime, timedelta
+    now = now or datetime.now()
+    current = wanted_contract_months(now)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    calendar = {}
+    for day in range(1, days + 1):
+        when = midnight + timedelta(days=day)
+        for key, month in wanted_contract_months(when).items():
+            if key not in calendar and month != current[key]:
+                calendar[key] = (when, month)
+    return calendar
+
+def build_ib_contracts(ib, months):
+    """Unqualified contracts for the asset keys in `months` (see wanted_contract_months)."""
+    from ib_insync import Contract
+
+    assets = asset_registry.assets
+    contracts = {}
+    for key, month in months.items():
+        asset = assets.get(key)
+        if not asset or not asset.get('contract'):
+            continue
+        if asset.get('lookup') == 'search':
+            # Month picked from what IB lists (e.g. GIFT Nifty: current month, next one after expiry)
+            contract = find_listed_contract(ib, key, asset['contract'], month)
+            if contract is not None:
+                contracts[key] = contract
+            continue
+        contract = Contract.create(**asset['contract'])
+        if month:
+            contract.lastTradeDateOrContractMonth = month
+            print(f"{key} requesting month: {month}", flush=True)
+        contracts[key] = contract
+    return contracts
+
+def find_listed_contract(ib, key, spec, front):
+    """Contract for month `front` (YYYYMM) among those IB lists for `spec`, or the next listed one after expiry."""
+    from ib_insync import Contract
+
+    print(f"{key} front month (target): {front}", flush=True)
+    try:
+        matches = ib.reqContractDetails(Contract.create(**spec))
+        if matches:
+            def norm_month(c):
+                raw = (getattr(c.contract, 'lastTradeDateOrContractMonth', '') or '').strip().replace(' ', '')
+                if len(raw) >= 6 and raw[:6].isdigit():
+                    return raw[:6]
+                try:
+                    if raw.isdigit():
+                        return raw[:6]
+                    months = {'JAN':1,'FEB':2,'MAR':3,'APR':4,'MAY':5,'JUN':6,'JUL':7,'AUG':8,'SEP':9,'OCT':10,'NOV':11,'DEC':12}
+                    for k, v in months.items():
+                        if raw.upper().startswith(k):
+                            yr = raw[len(k):].strip()
+                            if len(yr) == 2:
+                                yr = '20' + yr
+                            return f"{yr}{v:02d}"
+                except Exception:
+                    pass
+                return raw[:6] if raw else '999999'
+            # Sort by contract month ascending (Jan, Feb, Mar...)
+            matches_sorted = sorted(matches, key=lambda m: norm_month(m))
+            available_months = [norm_month(m) for m in matches_sorted]
+            print(f"{key} available months: {available_months}", flush=True)
+            # 1) Prefer exact current month (e.g. 202602 for Feb)
+            for m in matches_sorted:
+                if norm_month(m) == front:
+                    print(f"{key} using current month: {m.contract} ({getattr(m.contract, 'lastTradeDateOrContractMonth', '')})", flush=True)
+                    return m.contract
+            # 2) Only if no current month (e.g. after expiry), use next month
+            for m in matches_sorted:
+                if norm_month(m) > front:
+                    print(f"{key} rolled to next month: {m.contract} ({getattr(m.contract, 'lastTradeDateOrContractMonth', '')})", flush=True)
+                    return m.contract
+            print(f"{key} fallback: {matches_sorted[0].contract}", flush=True)
+            return matches_sorted[0].contract
+    except Exception as e:
+        print(f"{key} lookup error: {e}", flush=True)
+    print(f"{key} contract not found - skipping", flush=True)
+    return None
+
+def probe_ib_port(host, port, timeout=IB_PROBE_TIMEOUT):
+    import socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        return sock.connect_ex((host, port)) == 0
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+def find_ib_port(host=IB_HOST, ports=IB_PORTS, preferred=None):
+    """One of `ports` on `host` that accepts connections: `preferred` (the last good one) first, then all at once."""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    if preferred in ports and probe_ib_port(host, preferred, timeout=IB_PREFERRED_PROBE_TIMEOUT):
+        return preferred
+    pool = ThreadPoolExecutor(max_workers=len(ports))
+    try:
+        futures = {pool.submit(probe_ib_port, host, port): port for port in ports}
+        for future in as_completed(futures):
+            if future.result():
+                return futures[future]
+    finally:
+        pool.shutdown(wait=False)  # Don't wait out the slower probes
+    return None
+
+def load_ib_cache():
+    """The IB cache, read from IB_CACHE_PATH once and shared by every IB session in this process.
+
+    {'ports': {'host:clientId': last good port}, 'contracts': {key: entry}}
+    """
+    global _ib_cache
+    if _ib_cache is None:
+        _ib_cache = {}
+        if IB_CACHE_PATH:
             try:
-                nifty_search = Contract()
-                nifty_search.symbol = 'NIFTY'
-                nifty_search.secType = 'FUT'
-                nifty_search.exchange = 'SGX'
-                nifty_search.currency = 'USD'
-                matches = ib.reqContractDetails(nifty_search)
-                if matches:
-                    def norm_month(c):
-                        raw = (getattr(c.contract, 'lastTradeDateOrContractMonth', '') or '').strip().replace(' ', '')
-                        if len(raw) >= 6 and raw[:6].isdigit():
-                            return raw[:6]
-                        try:
-                            if raw.isdigit():
-                                return raw[:6]
-                            months = {'JAN':1,'FEB':2,'MAR':3,'APR':4,'MAY':5,'JUN':6,'JUL':7,'AUG':8,'SEP':9,'OCT':10,'NOV':11,'DEC':12}
-                            for k, v in months.items():
-                                if raw.upper().startswith(k):
-                                    yr = raw[len(k):].strip()
-                                    if len(yr) == 2:
-                                        yr = '20' + yr
-                                    return f"{yr}{v:02d}"
-                        except Exception:
-                            pass
-                        return raw[:6] if raw else '999999'
-                    # Sort by contract month ascending (Jan, Feb, Mar...)
-                    matches_sorted = sorted(matches, key=lambda m: norm_month(m))
-                    available_months = [norm_month(m) for m in matches_sorted]
-                    print(f"Nifty available months: {available_months}", flush=True)
-                    # 1) Prefer exact current month (e.g. 202602 for Feb)
-                    for m in matches_sorted:
-                        if norm_month(m) == nifty_front:
-                            contracts['nifty_futures'] = m.contract
-                            nifty_found = True
-                            print(f"Nifty using Feb/current month: {m.contract} ({getattr(m.contract, 'lastTradeDateOrContractMonth', '')})", flush=True)
-                            break
-                    # 2) Only if no current month (e.g. after expiry), use next month
-                    if not nifty_found:
-                        for m in matches_sorted:
-                            if norm_month(m) > nifty_front:
-                                contracts['nifty_futures'] = m.contract
-                                nifty_found = True
-                                print(f"Nifty rolled to next month: {m.contract} ({getattr(m.contract, 'lastTradeDateOrContractMonth', '')})", flush=True)
-                                break
-                    if not nifty_found and matches_sorted:
-                        contracts['nifty_futures'] = matches_sorted[0].contract
-                        nifty_found = True
-                        print(f"Nifty fallback: {matches_sorted[0].contract}", flush=True)
-            except Exception as e:
-                print(f"Nifty error: {e}", flush=True)
-            if not nifty_found:
-                print("Nifty contract not found - skipping", flush=True)
-            
-            # Qualify and subscribe
-            tickers = {}
-            ib.reqMarketDataType(1)  # 1 = live (use 3 for delayed if no subscription)
-            for key, contract in contracts.items():
+                with open(IB_CACHE_PATH) as f:
+                    _ib_cache = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"Could not read IB cache: {e}", flush=True)
+    return _ib_cache
+
+def save_ib_cache(cache):
+    if not IB_CACHE_PATH:
+        return
+    try:
+        tmp = IB_CACHE_PATH + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp, IB_CACHE_PATH)
+    except OSError as e:
+        print(f"Could not save IB cache: {e}", flush=True)
+
+def cached_contracts(cache, months):
+    """Qualified contracts from the cache that are still valid for `months`, by asset key.
+
+    An entry is used only if it was resolved from the asset's current
+    contract spec for the same wanted month, is younger than IB_CACHE_HOURS,
+    and its contract hasn't passed its last trading day.
+    """
+    from ib_insync import Contract
+
+    now = time.time()
+    today = time.strftime('%Y%m%d')
+    assets = asset_registry.assets
+    contracts = {}
+    for key, entry in cache.get('contracts', {}).items():
+        if key not in months or entry.get('wanted') != months[key]:
+            continue
+        if entry.get('spec') != assets.get(key, {}).get('contract'):
+            continue
+        if now - entry.get('cached_at', 0) > IB_CACHE_HOURS * 3600:
+            continue
+        fields = entry.get('contract') or {}
+        expiry = fields.get('lastTradeDateOrContractMonth', '')
+        if len(expiry) >= 8 and expiry[:8] < today:
+            continue
+        if fields.get('conId'):
+            contracts[key] = Contract.create(**fields)
+    return contracts
+
+class IBFeed(Feed):
+    """Live prices from IB Gateway via ib_insync.
+
+    Contract rolls happen on the live connection: when an asset key's roll
+    time comes up (see _plan_rolls), the new contract is subscribed alongside
+    the old one and swapped in on its first valid tick, after which the old
+    market data line is cancelled. Displays never see a gap.
+
+    Several sessions (different client IDs, or gateways) can run side by side
+    in the feed thread; they share its event loop and the contract cache.
+    """
+    name = 'IB'
+
+    def __init__(self, client_id=IB_CLIENT_ID, host=IB_HOST, ports=IB_PORTS, name=None):
+        super().__init__()
+        self.client_id = client_id
+        self.host = host
+        self.ports = ports
+        if name:
+            self.name = name
+        self.ib = None
+        self.tickers = {}
+        self._ticker_keys = {}
+        self._specs = {}     # key -> its asset's contract fields when it was subscribed
+        self._roll_at = {}   # key -> epoch when it should move to its next contract
+        self._rolling = {}   # id(new ticker) -> key, subscribed but not swapped in yet
+        self._loop = None
+        self._cache = load_ib_cache()
+        self._session = f"{host}:{client_id}"
+        self.port = self._cache.get('ports', {}).get(self._session)  # Last port IB Gateway answered on
+
+    @property
+    def connected(self):
+        return self.ib is not None and self.ib.isConnected()
+
+    def connect(self, on_tick):
+        started = time.time()
+        self._open(on_tick, self._find_port(), started)
+
+    async def connect_async(self, on_tick):
+        """connect() on a running event loop (asgi.py) without stalling it.
+
+        The port probe runs in a thread; ib_insync's blocking calls (connect,
+        contract lookups) run nested on the loop (util.patchAsyncio), so
+        everything else on it keeps going meanwhile.
+        """
+        import asyncio
+        from ib_insync import util
+
+        util.patchAsyncio()
+        started = time.time()
+        port = await asyncio.get_running_loop().run_in_executor(None, self._find_port)
+        self._open(on_tick, port, started)
+
+    def _find_port(self):
+        port = find_ib_port(self.host, self.ports, self.port)
+        if not port:
+            raise FeedUnavailable("IB Gateway not reachable on %s ports %s" % (self.host, self.ports))
+        print(f"IB Gateway found on port {port}", flush=True)
+        return port
+
+    def _open(self, on_tick, port, started):
+        """Connect to IB Gateway on `port` and subscribe."""
+        import asyncio
+
+        super().connect(on_tick)
+        if self._loop is None:
+            # ib_insync needs an event loop in this (feed) thread; other sessions here share it
+            try:
+                self._loop = asyncio.get_event_loop()
+            except RuntimeError:
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+
+        from ib_insync import IB
+
+        self.ib = IB()
+        print(f"Connecting to IB Gateway on port {port} (client {self.client_id})...", flush=True)
+        # readonly: we never trade, so skip syncing open/completed orders on connect
+        self.ib.connect(self.host, port, clientId=self.client_id, timeout=20, readonly=True)
+        print(f"Connected to Interactive Brokers! ({self.name})", flush=True)
+        self.port = self._cache.setdefault('ports', {})[self._session] = port
+
+        self.tickers = {}
+        self._ticker_keys = {}
+        self._specs = {}
+        self._rolling = {}
+        self.ib.reqMarketDataType(1)  # 1 = live (use 3 for delayed if no subscription)
+        # Tick ingestion is event driven: ib_insync hands us only the tickers
+        # that changed, as soon as their update is decoded.
+        self.ib.pendingTickersEvent += self._on_pending_tickers
+        self._sync_subscriptions()
+        print(f"Streaming {len(self.tickers)} symbols ({time.time() - started:.1f}s to subscribe)...", flush=True)
+
+    def set_keys(self, keys):
+        super().set_keys(keys)
+        if self.connected:
+            self._sync_subscriptions()
+
+    def _sync_subscriptions(self):
+        """Bring the market data lines in line with self.keys.
+
+        Only the first IB_MAX_LINES keys (most important first, see
+        AssetRegistry.feed_keys) get a line. Keys that dropped out are
+        cancelled, new ones subscribed and ones whose contract, roll or lookup
+        was edited subscribed again; every other line is left alone.
+        """
+        wanted = self.keys[:IB_MAX_LINES]
+        if len(self.keys) > IB_MAX_LINES:
+            print(f"Market data line limit ({IB_MAX_LINES}): not streaming {', '.join(self.keys[IB_MAX_LINES:])}", flush=True)
+        for key in [key for key in self.tickers if key not in wanted]:
+            self._unsubscribe(key)
+        edited = [key for key in self.tickers if self._specs.get(key) != self._spec(key)]
+        if edited:
+            print(f"Contract definition changed: {', '.join(edited)}", flush=True)
+            for key in edited:
+                self._unsubscribe(key)
+
+        added = [key for key in wanted if key not in self.tickers]
+        if added:
+            months = wanted_contract_months()
+            contracts = self._resolve_contracts({key: months[key] for key in added if key in months})
+            subscribed = []
+            for key in added:
+                contract = contracts.get(key)
+                if contract is None:
+                    print(f"Not streaming {key}: no contract (check its definition and market data permissions)", flush=True)
+                    continue
                 try:
-                    qualified = ib.qualifyContracts(contract)
-                    if qualified:
-                        ticker = ib.reqMktData(contract, '', False, False)
-                        tickers[key] = ticker
-                        print(f"Subscribed: {key} -> {contract}", flush=True)
-                    else:
-                        print(f"Could not qualify: {key}", flush=True)
+                    ticker = self.ib.reqMktData(contract, '', False, False)
                 except Exception as e:
                     print(f"Error with {key}: {e}", flush=True)
-            # If Nifty didn't qualify, try delayed data type for next connection
-            if 'nifty_futures' not in tickers and contracts.get('nifty_futures'):
-                print("Nifty: try enabling delayed market data in IBKR for SGX", flush=True)
-            
-            print(f"Streaming {len(tickers)} symbols...", flush=True)
-            
-            # Process updates: reconnect periodically to refresh contracts (e.g. after Nifty expiry)
-            reconnect_interval = 6 * 3600  # 6 hours
-            stale_threshold = 5 * 60      # 5 min without updates = force reconnect
-            last_update_time = time.time()
-            loop_start = time.time()
+                    continue
+                self.tickers[key] = ticker
+                self._ticker_keys[id(ticker)] = key
+                self._specs[key] = self._spec(key)
+                subscribed.append(ticker)
+                print(f"Subscribed: {key} -> {contract}", flush=True)
+            self._on_pending_tickers(subscribed)  # Seed with anything that arrived during subscription
+        self._plan_rolls()
+
+    def _unsubscribe(self, key):
+        ticker = self.tickers.pop(key)
+        self._ticker_keys.pop(id(ticker), None)
+        self._specs.pop(key, None)
+        self._roll_at.pop(key, None)
+        self.ib.cancelMktData(ticker.contract)
+        for ticker_id, (rolling_key, new_ticker) in list(self._rolling.items()):
+            if rolling_key == key:
+                del self._rolling[ticker_id]
+                self.ib.cancelMktData(new_ticker.contract)
+        print(f"Unsubscribed: {key}", flush=True)
+
+    @staticmethod
+    def _spec(key):
+        """What decides which instrument `key` streams."""
+        asset = asset_registry.assets.get(key, {})
+        return {field: asset.get(field) for field in ('contract', 'roll', 'lookup')}
+
+    @property
+    def subscribed(self):
+        return [key for key in self.keys if key in self.tickers]
+
+    @property
+    def expected(self):
+        return self.keys[:IB_MAX_LINES]  # The rest never get a line, so never tick
+
+    def resubscribe(self, key):
+        if key in self.tickers:
+            self._unsubscribe(key)
+            self._sync_subscriptions()  # Same contract, fresh market data line
+        elif key in self.keys[:IB_MAX_LINES]:
+            self._sync_subscriptions()  # Its lookup or subscription failed: try again
+
+    def _resolve_contracts(self, months):
+        """Qualified contracts for `months` ({key: wanted month}).
+
+        Still-valid entries come from the on-disk cache; the rest are looked up
+        and qualified in one concurrent batch, then cached.
+        """
+        from ib_insync import util
+
+        contracts = cached_contracts(self._cache, months)
+        missing = {key: month for key, month in months.items() if key not in contracts}
+        if contracts:
+            print(f"Using cached contracts for: {', '.join(contracts)}", flush=True)
+        if missing:
+            lookup = build_ib_contracts(self.ib, missing)
+            qualified = {id(c) for c in self.ib.qualifyContracts(*lookup.values())} if lookup else set()
+            for key, contract in lookup.items():
+                if id(contract) in qualified:
+                    contracts[key] = contract
+                    self._cache.setdefault('contracts', {})[key] = {
+                        'wanted': months[key], 'cached_at': time.time(),
+                        'spec': asset_registry.assets[key]['contract'],
+                        'contract': util.dataclassNonDefaults(contract),
+                    }
+                else:
+                    print(f"Could not qualify: {key}", flush=True)
+        save_ib_cache(self._cache)
+        return contracts
+
+    def _plan_rolls(self):
+        """Work out when each subscribed key next rolls.
+
+        That is the earlier of the roll calendar's month change and the day
+        after the held contract's last trading day.
+        """
+        from datetime import datetime, timedelta
+
+        now = datetime.now()
+        calendar = contract_roll_calendar(now)
+        self._roll_at = {}
+        for key, ticker in self.tickers.items():
+            when = calendar[key][0] if key in calendar else None
+            expiry = (ticker.contract.lastTradeDateOrContractMonth or '')[:8]
+            if len(expiry) == 8 and expiry.isdigit():
+                after_expiry = datetime.strptime(expiry, '%Y%m%d') + timedelta(days=1)
+                if after_expiry > now and (when is None or after_expiry < when):
+                    when = after_expiry
+            if when is not None:
+                self._roll_at[key] = when.timestamp()
+        if self._roll_at:
+            print("Next rolls: " + ', '.join(
+                f"{key} {time.strftime('%Y-%m-%d', time.localtime(at))}" for key, at in sorted(self._roll_at.items())
+            ), flush=True)
+
+    def _start_roll(self, key):
+        """Subscribe `key`'s next contract next to the current one; it is swapped in on its first tick."""
+        old = self.tickers[key]
+        month = wanted_contract_months().get(key, '')
+        contract = self._resolve_contracts({key: month}).get(key)
+        if contract is None:
+            print(f"Roll {key}: no contract for {month}, staying on {old.contract.localSymbol}", flush=True)
+            self._roll_at[key] = time.time() + ROLL_RETRY_SEC
+            return
+        if contract.conId == old.contract.conId:
+            self._plan_rolls()  # Already on it
+            return
+        ticker = self.ib.reqMktData(contract, '', False, False)
+        self._rolling[id(ticker)] = (key, ticker)
+        print(f"Rolling {key}: {old.contract.localSymbol} -> {contract.localSymbol}, waiting for first tick", flush=True)
+
+    def _finish_roll(self, ticker):
+        key, _ = self._rolling.pop(id(ticker))
+        old = self.tickers[key]
+        self.tickers[key] = ticker
+        self._ticker_keys[id(ticker)] = key
+        self._ticker_keys.pop(id(old), None)
+        self.ib.cancelMktData(old.contract)
+        print(f"Rolled {key}: now streaming {ticker.contract.localSymbol}", flush=True)
+        self.on_tick(key, ticker)
+        self._plan_rolls()
+
+    def _on_pending_tickers(self, updated):
+        with price_batch():  # One snapshot for the whole update
+            for ticker in updated:
+                key = self._ticker_keys.get(id(ticker))
+                if key is not None:
+                    self.on_tick(key, ticker)
+                elif id(ticker) in self._rolling and select_price(ticker):
+                    self._finish_roll(ticker)
+
+    def poll(self, timeout):
+        self.ib.sleep(timeout)  # Ticks are dispatched to _on_pending_tickers meanwhile
+        self._roll_due()
+
+    async def poll_async(self, timeout):
+        import asyncio
+
+        await asyncio.sleep(timeout)  # The loop itself reads from IB and dispatches ticks
+        self._roll_due()
+
+    def _roll_due(self):
+        now = time.time()
+        rolling = {key for key, _ in self._rolling.values()}
+        for key, roll_at in list(self._roll_at.items()):
+            if now >= roll_at and key not in rolling:
+                del self._roll_at[key]
+                self._start_roll(key)
+
+    def disconnect(self):
+        if self.ib:
+            self.ib.pendingTickersEvent -= self._on_pending_tickers
+            try:
+                self.ib.disconnect()
+            except:
+                pass
+            self.ib = None
+        self._rolling = {}
+        super().disconnect()
+
+def make_feed():
+    """The Feed selected by WALLCLOCK_FEED."""
+    if WALLCLOCK_FEED == 'sim':
+        return SimulatedFeed(asset_registry.feed_keys(), tick_rate=SIM_TICK_RATE, seed=SIM_SEED)
+    if WALLCLOCK_FEED == 'replay':
+        return ReplayFeed(REPLAY_PATH, speed=REPLAY_SPEED)
+    if IB_STANDBY_CLIENT_ID:
+        return FailoverFeed(
+            [IBFeed(name='IB primary'),
+             IBFeed(int(IB_STANDBY_CLIENT_ID), IB_STANDBY_HOST, IB_STANDBY_PORTS, name='IB standby')],
+            failover_after=FAILOVER_AFTER_SEC, failback_after=FAILBACK_AFTER_SEC,
+            on_switch=FEED_SWITCHES.inc,
+        )
+    return IBFeed()
+
+def demand_path(pid):
+    """Where web worker `pid` shares its viewers' keys with the feed process."""
+    return '%s.demand-%s' % (PRICE_BOARD_PATH, pid)
+
+def streamed_keys():
+    """Keys the feed should stream, most important first (see AssetRegistry.feed_keys):
+    what viewers show, and every asset without a card."""
+    keys = asset_registry.feed_keys()
+    if not SUBSCRIBE_ON_DEMAND:
+        return keys
+    if WALLCLOCK_ROLE == 'feed':
+        paths = [path for path in glob.glob(demand_path('*')) if not path.endswith('.tmp')]
+        wanted = wanted_keys(read_snapshot(path) for path in paths)
+    else:
+        wanted = wanted_keys([viewer_demand.snapshot()])
+    shown = asset_registry.shown_keys()
+    return [key for key in keys if key in wanted or key not in shown]
+
+def run_feed(feed):
+    """Keep `feed` connected and its ticks flowing into live_prices.
+
+    The same watchdog applies to every Feed: retry 10 s after an error (with
+    a re-auth notification after FAILURES_BEFORE_NOTIFY in a row); resubscribe
+    a single symbol that stops ticking while its market is open (check_symbols),
+    and reconnect only if nothing ticks for STALE_THRESHOLD_SEC.
+    Contract rolls are the feed's own business and never need a reconnect.
+    Every WATCHDOG_INTERVAL the streamed keys are brought in line with the
+    asset registry and viewer demand, without reconnecting.
+    """
+    global _consecutive_failures
+    
+    feed.set_keys(streamed_keys())
+    feed_state = new_feed_state()
+    on_tick = feed_tick_handler(feed_state)
+    
+    while True:
+        feed_state['last_update_time'] = time.time()
+        try:
+            feed.connect(on_tick)
+            set_ib_connected(True)
+            feed_state['expect_from'] = dict.fromkeys(feed.keys, time.time())
+            stats_gap(feed.keys)
+            _consecutive_failures = 0  # Reset so next time we need re-auth we can notify again
             
-            while ib.isConnected():
-                ib.sleep(0.1)  # Process events
-                now = time.time()
-                
-                for key, ticker in tickers.items():
-                    # Prefer live: bid/ask mid (best for futures), then last, then close
-                    price = None
-                    if ticker.bid and ticker.bid > 0 and ticker.ask and ticker.ask > 0:
-                        price = (ticker.bid + ticker.ask) / 2
-                    if (price is None or price <= 0) and ticker.last and ticker.last > 0:
-                        price = ticker.last
-                    if (price is None or price <= 0) and ticker.close and ticker.close > 0:
-                        price = ticker.close
-                    
-                    if price and price > 0:
-                        last_update_time = now
-                        prev_close = ticker.close if ticker.close and ticker.close > 0 else price
-                        change = price - prev_close
-                        change_pct = (change / prev_close * 100) if prev_close else 0
-                        
-                        old_price = live_prices.get(key, {}).get('price', 0)
-                        if abs(price - old_price) > 0.0001:
-                            data = {'price': price, 'change': change, 'change_pct': change_pct}
-                            live_prices[key] = data
-                            # Nasdaq row shows NQ (nasdaq_futures) price
-                            if key == 'nasdaq_futures':
-                                live_prices['nasdaq'] = data
-                            update_price_cache_from_live()
-                
-                # Periodic reconnect to refresh contracts (roll to next month after expiry)
-                if (now - loop_start) >= reconnect_interval:
-                    print("Periodic reconnect to refresh contracts...", flush=True)
-                    break
-                # Reconnect if no updates for too long (connection may be stale)
-                if (now - last_update_time) >= stale_threshold and price_cache['last_update']:
-                    print("No price updates for 5 min - reconnecting...", flush=True)
+            while feed.connected:
+                feed.poll(WATCHDOG_INTERVAL)
+                if not check_feed(feed, feed_state):
                     break
             
-            print("IB connection lost", flush=True)
-            ib_connected = False
-            
+            print(f"{feed.name} connection lost", flush=True)
+            set_ib_connected(False)
+        
+        except FeedUnavailable as e:
+            print(f"{e}.", flush=True)
         except Exception as e:
-            print(f"IBKR error: {type(e).__name__}: {e}", flush=True)
-            ib_connected = False
+            print(f"{feed.name} feed error: {type(e).__name__}: {e}", flush=True)
+            set_ib_connected(False)
         
         _consecutive_failures += 1
         if _consecutive_failures >= FAILURES_BEFORE_NOTIFY:
             send_reauth_notification()
         
         # Cleanup
-        if ib:
-            try:
-                ib.disconnect()
-            except:
-                pass
+        feed.disconnect()
         
         print("Retrying in 10 seconds...", flush=True)
         time.sleep(10)
 
+async def run_feed_async(feed):
+    """run_feed() as a task on the serving event loop (asgi.py): same watchdog, nothing blocks the loop."""
+    import asyncio
+    global _consecutive_failures
+    
+    feed.set_keys(streamed_keys())
+    feed_state = new_feed_state()
+    on_tick = feed_tick_handler(feed_state)
+    
+    while True:
+        feed_state['last_update_time'] = time.time()
+        try:
+            await feed.connect_async(on_tick)
+            set_ib_connected(True)
+            feed_state['expect_from'] = dict.fromkeys(feed.keys, time.time())
+            stats_gap(feed.keys)
+            _consecutive_failures = 0
+            
+            while feed.connected:
+                await feed.poll_async(WATCHDOG_INTERVAL)
+                if not check_feed(feed, feed_state):
+                    break
+            
+            print(f"{feed.name} connection lost", flush=True)
+            set_ib_connected(False)
+        
+        except FeedUnavailable as e:
+            print(f"{e}.", flush=True)
+        except Exception as e:
+            print(f"{feed.name} feed error: {type(e).__name__}: {e}", flush=True)
+            set_ib_connected(False)
+        
+        _consecutive_failures += 1
+        if _consecutive_failures >= FAILURES_BEFORE_NOTIFY:
+            send_reauth_notification()
+        
+        feed.disconnect()
+        
+        print("Retrying in 10 seconds...", flush=True)
+        await asyncio.sleep(10)
+
+def stats_gap(keys):
+    """Keys (re)subscribed: their next tick doesn't make a return or volume step from before the gap."""
+    for key in keys:
+        stats = symbol_stats.get(key)
+        if stats is not None:
+            stats.gap()
+
+def new_feed_state():
+    """Watchdog state for run_feed / run_feed_async (see check_feed and check_symbols)."""
+    return {
+        'assets_version': asset_registry.version,
+        'last_update_time': time.time(),  # Last valid tick from any symbol (or when none was expected)
+        'last_tick': {},                  # key -> last valid tick
+        'expect_from': {},                # key -> when it was (re)subscribed or its market last opened
+        'overdue': set(),                 # Keys resubscribed for going quiet, until they tick again
+        'resubscribes': {},               # key -> how often
+    }
+
+def feed_tick_handler(feed_state):
+    """on_tick for run_feed: ingest the tick and note when the last valid price came in."""
+    last_tick = feed_state['last_tick']
+    overdue = feed_state['overdue']
+    def on_tick(key, tick):
+        start = time.perf_counter()
+        if ingest_ticker(key, tick):
+            last_tick[key] = feed_state['last_update_time'] = time.time()
+            overdue.discard(key)
+        elapsed = time.perf_counter() - start
+        FEED_HANDLER.observe(elapsed)
+        FEED_BUSY.inc(amount=elapsed)
+    return on_tick
+
+def check_feed(feed, feed_state):
+    """Watchdog step while connected (every WATCHDOG_INTERVAL). Returns False if the feed should reconnect."""
+    now = time.time()
+    
+    # Asset changes (admin API, maybe in another process) and viewers coming
+    # and going: resubscribe only what changed
+    asset_registry.reload_if_changed()
+    keys = streamed_keys()
+    if keys != feed.keys or asset_registry.version != feed_state['assets_version']:
+        dropped = set(feed.keys) - set(keys)
+        added = set(keys) - set(feed.keys)
+        removed = dropped - set(asset_registry.assets)
+        if added:
+            print(f"Viewers want: {', '.join(sorted(added))}", flush=True)
+        if removed:
+            print(f"Removed from the asset registry: {', '.join(sorted(removed))}", flush=True)
+        if dropped - removed:
+            print(f"No viewers for {DEMAND_GRACE_SEC:.0f}s: {', '.join(sorted(dropped - removed))}", flush=True)
+        feed.set_keys(keys)
+        feed_state['last_update_time'] = now  # Quiet while nothing was streamed isn't stale
+        for key in added:
+            feed_state['expect_from'][key] = now
+        stats_gap(added)
+        if dropped or asset_registry.version != feed_state['assets_version']:
+            feed_state['assets_version'] = asset_registry.version
+            republish_prices(stale=dropped)
+    
+    check_symbols(feed, feed_state, now)
+    
+    # Reconnect if nothing at all ticks for too long while some market is open (connection may be stale)
+    if (now - feed_state['last_update_time']) >= STALE_THRESHOLD_SEC and price_snapshot.last_update and feed.keys:
+        print(f"No price updates for {STALE_THRESHOLD_SEC // 60} min - reconnecting...", flush=True)
+        return False
+    return True
+
+def check_symbols(feed, feed_state, now):
+    """Per-symbol watchdog: resubscribe just the symbols whose market is open but that stopped ticking.
+
+    A key that should have a line (feed.expected: not past IB_MAX_LINES) has
+    to tick within its stale_after (SYMBOL_STALE_SEC by default) of its last
+    tick, of being subscribed, or of its market opening (trading hours, see
+    tradinghours.py). One that doesn't is marked stale and gets a fresh market
+    data line, or another try at subscribing; every other line is left alone.
+    """
+    global feed_freshness
+    hours = asset_registry.hours
+    expect_from = feed_state['expect_from']
+    expected = feed.expected
+    market_open = False
+    for key in expected:
+        if key in hours and not hours[key].is_open(now):
+            expect_from[key] = now  # Nothing expected until it opens
+        else:
+            expect_from.setdefault(key, now)
+            market_open = True
+    if not market_open:
+        feed_state['last_update_time'] = now  # All closed (e.g. the weekend): silence is expected
+    
+    assets = asset_registry.assets
+    quiet = [
+        key for key in expected
+        if now - max(feed_state['last_tick'].get(key, 0), expect_from[key])
+        >= assets.get(key, {}).get('stale_after', SYMBOL_STALE_SEC)
+    ]
+    if quiet:
+        print(f"No ticks from {', '.join(quiet)} with the market open - resubscribing", flush=True)
+        for key in quiet:
+            feed.resubscribe(key)
+            expect_from[key] = now
+            feed_state['overdue'].add(key)
+            feed_state['resubscribes'][key] = feed_state['resubscribes'].get(key, 0) + 1
+            FEED_RESUBSCRIBES.inc(key)
+        stats_gap(quiet)
+        newly_stale = [key for key in quiet if key in live_prices and not live_prices[key].get('stale')]
+        if newly_stale:
+            republish_prices(stale=newly_stale)
+    feed_freshness = symbol_freshness(feed.subscribed, feed_state, now)
+
+def symbol_freshness(keys, feed_state, now):
+    """Per-symbol freshness for /api/status: {key: {state, last_tick, market_open, resubscribes}}.
+
+    `keys` are the ones with a market data line. state is one of
+        live          ticking
+        waiting       subscribed, or its market just opened; no tick yet
+        stale         market open but no ticks: resubscribed, still waiting
+        closed        outside its trading hours
+        unsubscribed  no line: no viewers, over IB_MAX_LINES, or its contract
+                      lookup failed (retried like a stale symbol)
+    """
+    hours = asset_registry.hours
+    streamed = set(keys)
+    freshness = {}
+    for key, asset in asset_registry.assets.items():
+        if asset.get('alias_of'):
+            continue
+        last_tick = feed_state['last_tick'].get(key)
+        market_open = key not in hours or hours[key].is_open(now)
+        if key not in streamed:
+            state = 'unsubscribed'
+        elif last_tick and now - last_tick < asset.get('stale_after', SYMBOL_STALE_SEC):
+            state = 'live'
+        elif not market_open:
+            state = 'closed'
+        elif key in feed_state['overdue']:
+            state = 'stale'
+        else:
+            state = 'waiting'
+        freshness[key] = {
+            'state': state, 'last_tick': last_tick, 'market_open': market_open,
+            'resubscribes': feed_state['resubscribes'].get(key, 0),
+        }
+    return freshness
+
+def seed_symbol_stats():
+    """After a restart, rebuild this session's statistics from the tick journal (SymbolStats.load).
+
+    The journal has no volume, so VWAP starts over with the process.
+    """
+    now = time.time()
+    hours = asset_registry.hours
+    sessions = {key: hours[key].session if key in hours else utc_day for key in asset_registry.feed_keys()}
+    since = {key: min(session(now)[0], now - max(WINDOWS.values())) for key, session in sessions.items()}
+    if not since:
+        return
+    days = range(int(min(since.values())), int(now) + 86400, 86400)
+    columns = {key: (array('d'), array('d')) for key in since}
+    for path in sorted({journal_path(JOURNAL_DIR, day) for day in days}):
+        if not os.path.exists(path):
+            continue
+        try:
+            reader = JournalReader(path)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}", flush=True)
+            continue
+        for ts, key, price, *_ in reader:
+            if key in columns and ts >= since[key]:
+                column_ts, column_price = columns[key]
+                column_ts.append(ts)
+                column_price.append(price)
+        reader.close()
+    seeded = 0
+    for key, (ts, price) in columns.items():
+        if ts:
+            symbol_stats[key] = SymbolStats(sessions[key])
+            symbol_stats[key].load(ts, price)
+            seeded += 1
+    if seeded:
+        print(f"Session statistics for {seeded} symbols restored from the journal ({time.time() - now:.1f}s)", flush=True)
+
+def load_price_snapshot():
+    """Warm start: publish the last saved prices, marked stale, until live ticks replace them."""
+    try:
+        with open(PRICE_SNAPSHOT_PATH) as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        print(f"Could not read price snapshot: {e}", flush=True)
+        return
+    
+    assets = asset_registry.assets
+    prices = {key: data for key, data in saved.get('prices', {}).items() if key in assets and data.get('price')}
+    if not prices:
+        return
+    version = price_snapshot.version + 1
+    for data in prices.values():
+        data['stale'] = True
+        data['seq'] = version
+    store_prices(prices)
+    update_price_cache_from_live(version)
+    age = time.time() - saved.get('saved_at', 0)
+    print(f"Warm start: {len(prices)} last-known prices from {age:.0f}s ago", flush=True)
+
+def save_price_snapshot():
+    prices = {key: {k: v for k, v in data.items() if k != 'seq'} for key, data in live_prices.items()}
+    tmp = PRICE_SNAPSHOT_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'saved_at': time.time(), 'prices': prices}, f)
+    os.replace(tmp, PRICE_SNAPSHOT_PATH)
+
+def run_snapshot_saver():
+    """Save live_prices to disk every SNAPSHOT_SAVE_SEC while they keep changing."""
+    saved_version = price_snapshot.version
+    while True:
+        time.sleep(SNAPSHOT_SAVE_SEC)
+        version = price_snapshot.version
+        if version != saved_version:
+            try:
+                save_price_snapshot()
+                saved_version = version
+            except OSError as e:
+                print(f"Could not save price snapshot: {e}", flush=True)
+
+def feed_metrics_path():
+    return PRICE_BOARD_PATH + '.metrics'
+
+def feed_freshness_path():
+    return PRICE_BOARD_PATH + '.freshness'
+
+def run_metrics_writer():
+    """Feed process: publish this process's metrics and symbol freshness for the web workers."""
+    while True:
+        time.sleep(METRICS_DUMP_SEC)
+        for path, content in ((feed_metrics_path(), metrics.render()), (feed_freshness_path(), json.dumps(feed_freshness))):
+            try:
+                with open(path + '.tmp', 'w') as f:
+                    f.write(content)
+                os.replace(path + '.tmp', path)
+            except OSError as e:
+                print(f"Could not write {path}: {e}", flush=True)
+
+def run_demand_writer():
+    """Web worker: tell the feed process which keys this worker's clients are showing."""
+    path = demand_path(os.getpid())
+    tmp = path + '.tmp'
+    while True:
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(viewer_demand.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not write viewer demand: {e}", flush=True)
+        time.sleep(DEMAND_WRITE_SEC)
+
+def run_board_follower():
+    """Web worker: mirror the feed process's price board into this process's cache."""
+    global ib_connected, _BOOT_ID
+    board = None
+    board_inode = None
+    seen = 0
+    next_inode_check = 0
+    
+    while True:
+        now = time.time()
+        if now >= next_inode_check:
+            # The feed process recreates the board when it restarts
+            next_inode_check = now + 1
+            try:
+                inode = os.stat(PRICE_BOARD_PATH).st_ino
+                if inode != board_inode:
+                    board = PriceBoard(PRICE_BOARD_PATH)
+                    board_inode = inode
+                    _BOOT_ID = '%x' % board.boot_id
+                    seen = 0
+                    # Keep showing last-known prices, but their seqs belonged to the old board
+                    set_live_prices({key: dict(data, seq=0) for key, data in live_prices.items()})
+                    print(f"Following price board {PRICE_BOARD_PATH}", flush=True)
+            except (OSError, ValueError):
+                pass  # Feed process hasn't created it yet
+        
+        if board is not None:
+            ib_connected = board.connected
+            version = board.version  # Before the slots: see PriceBoard.read_since
+            if version != seen:
+                changed, complete = board.read_since(seen)
+                seen = version
+                if not complete:
+                    # A slot stuck mid-write: the feed process may have died mid-update
+                    print("Price board slot stuck mid-write - checking for a restarted feed process", flush=True)
+                    next_inode_check = 0
+                if changed:
+                    asset_registry.reload_if_changed()  # The feed process republishes after an asset change
+                    assets = asset_registry.assets
+                    gone = {key for key, data in changed.items() if data.get('removed')}
+                    gone.update(key for key in live_prices if key not in assets)
+                    if gone:
+                        set_live_prices({key: data for key, data in live_prices.items() if key not in gone})
+                    changed = {key: data for key, data in changed.items() if key not in gone}
+                    store_prices(changed)
+                    update_price_cache_from_live(version=version)
+                    published = price_snapshot.last_update
+                    for key, data in changed.items():
+                        if not data.get('stale'):
+                            BOARD_LAG.observe(published - data['ts'], key)
+        
+        time.sleep(BOARD_POLL_SEC)
+
+def apply_relay_payload(payload, upstream_seqs):
+    """Relay mode: publish the prices in an upstream /api/prices payload as our next version.
+
+    Only assets this server's registry knows are mirrored (matched on the display
+    symbol). `upstream_seqs` ({key: (upstream seq, stale)}) remembers what was
+    taken already, so only quotes that changed upstream get the new seq here.
+    Returns the keys published ({key: data}; empty if nothing changed).
+    """
+    changed = {}
+    version = price_snapshot.version + 1
+    for quote in payload['quoteResponse']['result']:
+        key = asset_registry.key_for(quote['symbol'])
+        if not key:
+            continue
+        key = asset_registry.price_key(key)  # An alias row carries its asset's price
+        seen = (quote.get('seq', 0), bool(quote.get('stale')))
+        if key in changed or upstream_seqs.get(key) == seen:
+            continue
+        upstream_seqs[key] = seen
+        data = {
+            'price': quote['regularMarketPrice'], 'change': quote['regularMarketChange'],
+            'change_pct': quote['regularMarketChangePercent'],
+            'bid': 0.0, 'ask': 0.0, 'ts': quote.get('regularMarketTime') or time.time(), 'seq': version,
+        }
+        for field, name in STATS_QUOTE_FIELDS.items():
+            if name in quote:
+                data[field] = quote[name]
+        if seen[1]:
+            data['stale'] = True
+        changed[key] = data
+    if changed:
+        store_prices(changed)
+        update_price_cache_from_live(version)
+    return changed
+
+def run_relay():
+    """Relay mode: mirror RELAY_UPSTREAM - its snapshot, then its stream - and resync whenever it drops.
+
+    Versions here are our own, so they keep counting up (and the price board
+    keeps working) when the upstream restarts and starts again from 1.
+    """
+    upstream = Upstream(RELAY_UPSTREAM, stream_timeout=SSE_HEARTBEAT_SEC * 3)
+    upstream_boot = None
+    upstream_seqs = {}
+    
+    while True:
+        try:
+            boot, version, payload = upstream.snapshot()
+            if boot != upstream_boot:
+                upstream_boot = boot
+                upstream_seqs.clear()  # Its seqs started over; take every quote again
+                print(f"Relaying {RELAY_UPSTREAM} (boot {boot}) from version {version}", flush=True)
+            RELAY_RESYNCS.inc()
+            apply_relay_payload(payload, upstream_seqs)
+            set_ib_connected(True)
+            relay_state.update(connected=True, seq=version, last_event=time.time())
+            
+            for version, payload in upstream.events(version):
+                changed = apply_relay_payload(payload, upstream_seqs)
+                relay_state.update(seq=version, last_event=time.time())
+                if changed and 'published' in payload:
+                    # Upstream publish -> ours. Not for the resync snapshot: that version
+                    # may have been published long before we asked for it.
+                    lag = max(0.0, price_snapshot.last_update - payload['published'])
+                    relay_state['lag_seconds'] = round(lag, 3)
+                    for key in changed:
+                        RELAY_LAG.observe(lag, key)
+            print("Upstream stream ended", flush=True)
+        except (OSError, ValueError, KeyError, UpstreamError) as e:
+            print(f"Relay upstream {RELAY_UPSTREAM} unavailable: {e}", flush=True)
+        
+        relay_state['connected'] = False
+        set_ib_connected(False)
+        time.sleep(RELAY_RETRY_SEC)
+
 def start_background_updater():
-    """Start the IBKR connection"""
+    """Start the IBKR connection (or, in a web worker, follow the feed process)"""
     global _updater_started
     if not _updater_started:
         _updater_started = True
         
-        print("Starting Interactive Brokers connection...", flush=True)
-        ib_thread = threading.Thread(target=run_ibkr_connection, daemon=True)
-        ib_thread.start()
-        print("IBKR thread started", flush=True)
+        if WALLCLOCK_ROLE == 'web':
+            print("Following prices from the feed process...", flush=True)
+            threading.Thread(target=run_board_follower, daemon=True).start()
+            if SUBSCRIBE_ON_DEMAND:
+                threading.Thread(target=run_demand_writer, daemon=True).start()
+            return
+        
+        if PRICE_SNAPSHOT_PATH:
+            load_price_snapshot()
+            threading.Thread(target=run_snapshot_saver, daemon=True).start()
+        if WALLCLOCK_ROLE == 'feed':
+            threading.Thread(target=run_metrics_writer, daemon=True).start()
+        if RELAY_UPSTREAM:
+            print(f"Relaying prices from {RELAY_UPSTREAM}...", flush=True)
+            threading.Thread(target=run_relay, daemon=True).start()
+            return
+        if tick_journal is not None:
+            seed_symbol_stats()
+        if WALLCLOCK_ROLE == 'async':
+            return  # asgi.py runs the feed on its event loop
+
+        feed = make_feed()
+        print(f"Starting {feed.name} feed...", flush=True)
+        feed_thread = threading.Thread(target=run_feed, args=(feed,), daemon=True)
+        feed_thread.start()
+        print("Feed thread started", flush=True)
 
 # Start updater when app is imported
 start_background_updater()
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(route, response.status_code)
+    HTTP_DURATION.observe(time.perf_counter() - g.request_start, route)
+    return response
+
+# ============== Static files (from memory, see staticfiles.py) ==============
+# Pages, the manifest and the service worker revalidate on every load (a 304 when
+# unchanged); images may be reused for STATIC_IMAGE_MAX_AGE without asking. sw.js
+# carries a hash of everything it caches, so any change installs a new cache.
+STATIC_IMAGE_MAX_AGE = 7 * 86400
+static_files = StaticFiles(os.path.dirname(os.path.abspath(__file__)))
+static_files.add('index.html', 'text/html; charset=utf-8')
+static_files.add('manifest.json', 'application/manifest+json')
+for _name in ('logo.png', 'icon-192.png', 'icon-512.png'):
+    static_files.add(_name, 'image/png', 'public, max-age=%d' % STATIC_IMAGE_MAX_AGE)
+static_files.add('sw.js', 'application/javascript', replace={'{{version}}': static_files.version()})
+
+def serve_static(name):
+    static_file = static_files.files[name]
+    coding = pick_encoding(static_file, request.accept_encodings)
+    tag = etag(static_file, coding)
+    headers = {'ETag': '"%s"' % tag, 'Cache-Control': static_file.cache_control}
+    if len(static_file.bodies) > 1:
+        headers['Vary'] = 'Accept-Encoding'
+    if request.if_none_match.contains_weak(tag):
+        return Response(status=304, headers=headers)
+    if coding:
+        headers['Content-Encoding'] = coding
+    return Response(static_file.bodies[coding], content_type=static_file.mimetype, headers=headers)
+
 @app.route('/')
 def index():
-    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'))
+    return serve_static('index.html')
 
 @app.route('/logo.png')
 def logo():
-    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logo.png'), mimetype='image/png')
+    return serve_static('logo.png')
 
 @app.route('/manifest.json')
 def manifest():
-    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manifest.json'), mimetype='application/json')
+    return serve_static('manifest.json')
 
 @app.route('/sw.js')
 def service_worker():
-    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sw.js'), mimetype='application/javascript')
+    return serve_static('sw.js')
 
 @app.route('/icon-192.png')
 def icon_192():
-    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icon-192.png'), mimetype='image/png')
+    return serve_static('icon-192.png')
 
 @app.route('/icon-512.png')
 def icon_512():
-    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icon-512.png'), mimetype='image/png')
+    return serve_static('icon-512.png')
 
 @app.route('/screen.png')
 def screen():
@@ -461,37 +1604,250 @@ def screen():
         return send_file('/tmp/screen.png', mimetype='image/png')
     return "No screenshot available", 404
 
+_card_keys = (None, [])  # (registry version, price keys of the displayed assets)
+
+def requested_keys(symbols):
+    """Price keys a client shows: ?symbols=<key or display symbol>,... or by default every card."""
+    global _card_keys
+    if symbols:
+        keys = (asset_registry.key_for(symbol) for symbol in symbols.split(','))
+        return {asset_registry.price_key(key) for key in keys if key}
+    version, keys = _card_keys
+    if version != asset_registry.version:
+        assets = asset_registry.assets
+        keys = {asset_registry.price_key(key) for key, asset in assets.items() if asset.get('display', True)}
+        _card_keys = (asset_registry.version, keys)
+    return keys
+
 @app.route('/api/prices')
 def api_prices():
-    with price_cache['lock']:
-        data = price_cache['data']
+    """Latest prices. Each request keeps its symbols (see requested_keys) streaming for DEMAND_GRACE_SEC."""
+    viewer_demand.touch(requested_keys(request.args.get('symbols')))
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return prices_since(since, request.args.get('wait', 0, type=float))
     
-    if data:
-        return jsonify(data)
-    else:
+    snapshot = price_snapshot  # Single reference read; snapshots are never mutated
+    
+    if snapshot.data is None:
+        PRICE_RESPONSES.inc('unavailable')
         return jsonify({'error': 'Waiting for IB Gateway connection...', 'retry': True}), 503
+    
+    coding = 'gzip' if request.accept_encodings['gzip'] > 0 else ''
+    tag = price_etag(snapshot, coding)
+    headers = {'ETag': tag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains_weak(tag.strip('"')):
+        PRICE_RESPONSES.inc('not_modified')
+        return Response(status=304, headers=headers)
+    
+    PRICE_RESPONSES.inc('full')
+    if coding:
+        headers['Content-Encoding'] = coding
+        return Response(snapshot.gzip_body, mimetype='application/json', headers=headers)
+    return Response(snapshot.body, mimetype='application/json', headers=headers)
+
+def prices_since(since, wait):
+    """Delta response for /api/prices?since=<seq>[&wait=<sec>].
+
+    Only quotes whose seq is newer than `since` are returned, plus the current
+    seq to pass next time. With `wait`, the request is held (long-poll) until
+    something changes or the timeout passes; a timeout returns an empty result.
+    """
+    wait = max(0.0, min(wait, LONG_POLL_MAX_SEC))
+    changed = price_changed.event()
+    snapshot = price_snapshot
+    if wait and snapshot.version == since:
+        changed.wait(wait)  # Any new version differs from `since`
+        snapshot = price_snapshot
+    
+    if snapshot.data is None:
+        PRICE_RESPONSES.inc('unavailable')
+        return jsonify({'error': 'Waiting for IB Gateway connection...', 'retry': True}), 503
+    
+    PRICE_RESPONSES.inc('delta')
+    response = jsonify(delta_payload(snapshot, since))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def delta_payload(snapshot, since):
+    """The quotes in `snapshot` newer than `since`, plus the seq to pass next time."""
+    quotes = snapshot.data['quoteResponse']['result']
+    if since <= snapshot.version:
+        quotes = [q for q in quotes if q['seq'] > since]
+    # else: client is ahead of us (server restarted), so it gets everything
+    return {'quoteResponse': {'result': quotes}, 'seq': snapshot.version, 'assets': snapshot.data['assets']}
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: push the price payload only when it changes.
+
+    Event ids are the cache version, so a reconnecting EventSource resumes via
+    Last-Event-ID and only gets a snapshot if it missed something. The
+    stream's symbols (see requested_keys) stay subscribed while it is open.
+    """
+    try:
+        last_seen = int(request.headers.get('Last-Event-ID') or request.args.get('lastEventId') or -1)
+    except ValueError:
+        last_seen = -1
+    keys = requested_keys(request.args.get('symbols'))
+
+    def generate():
+        seen = last_seen
+        viewer_demand.acquire(keys)  # The stream's symbols stay subscribed while it is open
+        try:
+            yield b'retry: 2000\n\n'
+            while True:
+                changed = price_changed.event()
+                snapshot = price_snapshot
+                if snapshot.version == seen:
+                    changed.wait(SSE_HEARTBEAT_SEC)
+                    snapshot = price_snapshot
+                if snapshot.data is not None and snapshot.version != seen:
+                    seen = snapshot.version
+                    STREAM_EVENTS.inc('prices')
+                    yield b'id: %d\nevent: prices\ndata: %s\n\n' % (snapshot.version, snapshot.body)
+                else:
+                    STREAM_EVENTS.inc('heartbeat')
+                    yield b': heartbeat\n\n'
+        finally:
+            viewer_demand.release(keys)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # let nginx pass events through unbuffered
+    })
+
+@app.route('/api/history')
+def api_history():
+    """OHLC bars from the in-memory tick history: ?symbol=gold|XAU/USD&from=<epoch>&bar=1s|1m|5m"""
+    symbol = request.args.get('symbol', '')
+    bar = request.args.get('bar', '1m')
+    since = request.args.get('from', 0, type=float)
+    
+    key = asset_registry.key_for(symbol)
+    if key is None:
+        return jsonify({'error': 'Unknown symbol: %s' % symbol}), 400
+    if bar not in BAR_SECONDS:
+        return jsonify({'error': 'bar must be one of %s' % ', '.join(BAR_SECONDS)}), 400
+    
+    # An alias (e.g. the Nasdaq row) has the history of the asset it shows
+    ring = tick_history.get(asset_registry.price_key(key))
+    bars = ring.ohlc(BAR_SECONDS[bar], since) if ring else {column: [] for column in 'tohlcn'}
+    return jsonify(dict(bars, symbol=asset_registry.assets[key]['display_symbol'], bar=bar))
 
 @app.route('/api/status')
 def api_status():
-    return jsonify({
+    status = {
         'ib_connected': ib_connected,
+        'feed': 'relay' if RELAY_UPSTREAM else WALLCLOCK_FEED,
         'prices_count': len(live_prices),
-        'last_update': price_cache['last_update']
-    })
+        'last_update': price_snapshot.last_update
+    }
+    if RELAY_UPSTREAM:
+        status['relay'] = {'upstream': RELAY_UPSTREAM}
+        if WALLCLOCK_ROLE != 'web':  # In gunicorn the feed process relays; workers only see the board
+            status['relay'].update(relay_state)
+    elif WALLCLOCK_ROLE == 'web':
+        status['symbols'] = read_snapshot(feed_freshness_path())  # Written by the feed process
+    else:
+        status['symbols'] = feed_freshness  # See symbol_freshness
+    return jsonify(status)
+
+@app.route('/metrics')
+def api_metrics():
+    """Prometheus text format. In gunicorn, each scrape reaches one worker plus the feed process.
+
+    A worker's own samples carry worker="<pid>": its counters only count its
+    own requests, so each worker's series stays monotonic whichever one answers.
+    """
+    if WALLCLOCK_ROLE != 'web':
+        text = metrics.render()
+    else:
+        text = metrics.render(worker=os.getpid())
+        try:
+            with open(feed_metrics_path()) as f:
+                text += f.read()
+        except OSError:
+            pass  # Feed process hasn't written any yet
+    return Response(text, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/sources')
 def api_sources():
     """Which IBKR tickers/contracts we use for each asset."""
     return jsonify({
-        'gold': 'GC (COMEX Gold, 100 oz, contract months Feb/Apr/Jun/Aug/Oct/Dec, auto-roll)',
-        'silver': 'SI (COMEX Silver, 5000 oz, contract months Mar/May/Sep/Dec, auto-roll)',
-        'sp500': 'SPX (CBOE index)',
-        'nasdaq': 'NQ (CME Nasdaq 100 E-mini futures)',
-        'sp500_futures': 'ES (CME E-mini S&P 500 futures)',
-        'nasdaq_futures': 'NQ (CME Nasdaq 100 E-mini futures)',
-        'nifty_futures': 'NIFTY (GIFT Nifty, SGX, front month = current month, auto-roll after expiry)',
+        key: asset.get('source') or '%s (%s)' % (
+            asset['contract']['symbol'] if asset.get('contract') else asset['alias_of'],
+            asset['contract'].get('exchange', '') if asset.get('contract') else 'alias',
+        )
+        for key, asset in asset_registry.assets.items()
+    })
+
+@app.route('/api/assets')
+def api_assets():
+    """Cards for the wall clock, in display order. `version` changes whenever the registry does."""
+    asset_registry.reload_if_changed()
+    return jsonify({
+        'version': asset_registry.version,
+        'assets': [
+            {
+                'key': key, 'name': asset['name'], 'symbol': asset['display_symbol'],
+                'decimals': asset.get('decimals', 2), 'color': asset.get('color', ''),
+            }
+            for key, asset in asset_registry.assets.items() if asset.get('display', True)
+        ],
     })
 
+def admin_error():
+    """Error response unless the request carries `Authorization: Bearer <ADMIN_TOKEN>`."""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin API disabled (set ADMIN_TOKEN)'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + ADMIN_TOKEN):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@app.route('/api/admin/assets')
+def admin_list_assets():
+    """The full registry, plus the order assets get market data lines in."""
+    error = admin_error()
+    if error:
+        return error
+    asset_registry.reload_if_changed()
+    return jsonify({
+        'version': asset_registry.version,
+        'assets': list(asset_registry.assets.values()),
+        'line_order': asset_registry.feed_keys(),
+        'max_lines': IB_MAX_LINES,
+    })
+
+@app.route('/api/admin/assets/<key>', methods=['PUT', 'DELETE'])
+def admin_asset(key):
+    """PUT: add or replace an asset (JSON body, see assets.py). DELETE: remove it.
+
+    The feed subscribes / unsubscribes just that asset within a second;
+    nothing else is touched and the IB connection stays up.
+    """
+    error = admin_error()
+    if error:
+        return error
+    try:
+        if request.method == 'DELETE':
+            asset_registry.remove(key)
+            print(f"Asset removed: {key}", flush=True)
+            return jsonify({'version': asset_registry.version, 'removed': key})
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        asset = dict(body, key=key)
+        asset_registry.put(asset)
+        print(f"Asset saved: {key}", flush=True)
+        return jsonify({'version': asset_registry.version, 'asset': asset})
+    except KeyError:
+        return jsonify({'error': 'Unknown asset: %s' % key}), 404
+    except AssetError as e:
+        return jsonify({'error': str(e)}), 400 if request.method == 'PUT' else 409
+    except OSError as e:
+        return jsonify({'error': 'Could not save %s: %s' % (ASSETS_PATH, e)}), 500
+
 def get_local_ip():
     import socket
     try:
@@ -504,6 +1860,12 @@ def get_local_ip():
         return "YOUR_IP"
 
 if __name__ == '__main__':
+    if WALLCLOCK_ROLE == 'feed':
+        # Feed process: the IB thread does all the work, HTTP is served by the web workers
+        print(f"Feed process publishing to {PRICE_BOARD_PATH}", flush=True)
+        while True:
+            time.sleep(3600)
+    
     local_ip = get_local_ip()
     
     print("\n" + "="*60)
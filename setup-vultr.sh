@@ -39,7 +39,7 @@ Type=simple
 User=root
 WorkingDirectory=/root/wall-clock
 Environment=PATH=/root/wall-clock/venv/bin:/usr/bin:/bin
-ExecStart=/root/wall-clock/venv/bin/gunicorn server:app --bind 0.0.0.0:80 --workers 1 --threads 2
+ExecStart=/root/wall-clock/venv/bin/gunicorn server:app --config gunicorn.conf.py --bind 0.0.0.0:80
 Restart=always
 RestartSec=3
 
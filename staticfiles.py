@@ -0,0 +1,66 @@
+"""
+Static files for the wall clock, held in memory.
+
+Each file is read once, compressed once (gzip, plus brotli when the `brotli`
+package is installed) and given a content-hash ETag, so serving it is a dict
+lookup. Already-compressed types (images) are kept as they are. Changes on
+disk are picked up on restart.
+"""
+
+import gzip
+import hashlib
+import os
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Types worth compressing; everything else (PNG, ...) is sent as is
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/manifest+json', 'image/svg+xml')
+
+# bodies: {content coding ('' = identity): bytes}; compressed versions only where they are smaller
+StaticFile = namedtuple('StaticFile', ['name', 'mimetype', 'cache_control', 'digest', 'bodies'])
+
+
+class StaticFiles:
+    def __init__(self, root):
+        self.root = root
+        self.files = {}  # name -> StaticFile
+
+    def add(self, name, mimetype, cache_control='no-cache', replace=None):
+        """Load `name` from the root directory; `replace` maps placeholders to values first."""
+        with open(os.path.join(self.root, name), 'rb') as f:
+            body = f.read()
+        for old, new in (replace or {}).items():
+            body = body.replace(old.encode('utf-8'), new.encode('utf-8'))
+        bodies = {'': body}
+        if mimetype.startswith(COMPRESSIBLE):
+            compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(body, quality=11)
+            bodies.update((coding, data) for coding, data in compressed.items() if len(data) < len(body))
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.files[name] = StaticFile(name, mimetype, cache_control, digest, bodies)
+        return self.files[name]
+
+    def version(self, names=None):
+        """Short hash over the contents of `names` (default: every loaded file)."""
+        h = hashlib.sha256()
+        for name in sorted(names or self.files):
+            h.update(self.files[name].digest.encode('ascii'))
+        return h.hexdigest()[:12]
+
+
+def pick_encoding(static_file, accept_encodings):
+    """Content coding to send: brotli, then gzip, if the client takes it (q > 0) and we have it ('' = identity)."""
+    for coding in ('br', 'gzip'):
+        if coding in static_file.bodies and accept_encodings[coding] > 0:
+            return coding
+    return ''
+
+
+def etag(static_file, coding):
+    """Strong ETag for one encoding of the file (each encoding is a different representation)."""
+    return '%s-%s' % (static_file.digest, coding) if coding else static_file.digest
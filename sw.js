@@ -1,22 +1,25 @@
 // Service Worker for Safron Live Prices PWA
-const CACHE_NAME = 'safron-prices-v1';
+// The server fills in {{version}} with a hash of the files below, so any change
+// to them ships a new service worker with a fresh cache.
+const CACHE_NAME = 'safron-prices-{{version}}';
 const urlsToCache = [
     '/',
-    '/index.html',
     '/logo.png',
-    '/manifest.json'
+    '/manifest.json',
+    '/icon-192.png',
+    '/icon-512.png'
 ];
 
-// Install event
+// Install event - fetch everything past the HTTP cache so the new version is complete
 self.addEventListener('install', event => {
     event.waitUntil(
         caches.open(CACHE_NAME)
-            .then(cache => cache.addAll(urlsToCache))
+            .then(cache => cache.addAll(urlsToCache.map(url => new Request(url, { cache: 'reload' }))))
             .then(() => self.skipWaiting())
     );
 });
 
-// Activate event
+// Activate event - drop the caches of older versions
 self.addEventListener('activate', event => {
     event.waitUntil(
         caches.keys().then(cacheNames => {
@@ -31,27 +34,17 @@ self.addEventListener('activate', event => {
     );
 });
 
-// Fetch event - Network first for API, cache first for assets
+// Fetch event - cache first for the app's own files, network for everything else
 self.addEventListener('fetch', event => {
     const url = new URL(event.request.url);
-    
-    // Always fetch API calls from network (live prices)
-    if (url.pathname.includes('/api/')) {
-        event.respondWith(fetch(event.request));
+
+    // API calls (live prices) and anything not cached above go to the network
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin || !urlsToCache.includes(url.pathname)) {
         return;
     }
-    
-    // For other requests, try network first, fall back to cache
+
     event.respondWith(
-        fetch(event.request)
-            .then(response => {
-                // Clone and cache the response
-                const responseClone = response.clone();
-                caches.open(CACHE_NAME).then(cache => {
-                    cache.put(event.request, responseClone);
-                });
-                return response;
-            })
-            .catch(() => caches.match(event.request))
+        caches.match(url.pathname, { cacheName: CACHE_NAME })
+            .then(cached => cached || fetch(event.request))
     );
 });
@@ -0,0 +1,79 @@
+"""FailoverFeed switching, on a fake clock (python -m pytest test_feeds.py)."""
+
+import feeds
+from feeds import FailoverFeed, Feed, Tick
+
+
+class Member(Feed):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_failover(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(feeds.time, 'monotonic', clock)
+    primary, standby = Member('primary'), Member('standby')
+    feed = FailoverFeed([primary, standby], failover_after=1.0, failback_after=5.0)
+    delivered = []
+    feed.connect(lambda key, tick: delivered.append((key, tick.last)))
+    return feed, clock, primary, standby, delivered
+
+
+def test_skewed_sessions_on_a_sparse_market_do_not_fail_over(monkeypatch):
+    feed, clock, primary, standby, _ = make_failover(monkeypatch)
+    for second in range(30):  # A tick every 2 s; the standby's copy arrives 20 ms before the primary's
+        clock.now += 2.0
+        standby.on_tick('gold', Tick(0, 0, 100 + second, 0))
+        clock.now += 0.01
+        feed._check()
+        clock.now += 0.01
+        primary.on_tick('gold', Tick(0, 0, 100 + second, 0))
+        feed._check()
+    assert feed.active == 0
+
+
+def test_fails_over_when_the_primary_stops_and_the_standby_keeps_ticking(monkeypatch):
+    feed, clock, primary, standby, delivered = make_failover(monkeypatch)
+    primary.on_tick('gold', Tick(0, 0, 100, 0))
+    standby.on_tick('gold', Tick(0, 0, 100, 0))
+    for price in (101, 102, 103):
+        clock.now += 0.4
+        standby.on_tick('gold', Tick(0, 0, price, 0))
+        feed._check()
+    assert feed.active == 1
+    assert delivered[-1] == ('gold', 103)
+
+
+def test_nothing_ticking_is_not_a_failure(monkeypatch):
+    feed, clock, primary, standby, _ = make_failover(monkeypatch)
+    primary.on_tick('gold', Tick(0, 0, 100, 0))
+    standby.on_tick('gold', Tick(0, 0, 100, 0))
+    clock.now += 3600
+    feed._check()
+    assert feed.active == 0
+
+
+def test_failback_does_not_replay_older_prices(monkeypatch):
+    feed, clock, primary, standby, delivered = make_failover(monkeypatch)
+    primary.on_tick('gold', Tick(0, 0, 100, 0))
+    standby.on_tick('gold', Tick(0, 0, 100, 0))
+    clock.now += 2
+    standby.on_tick('gold', Tick(0, 0, 105, 0))
+    feed._check()
+    assert feed.active == 1
+    for _ in range(7):  # Primary back, ticking another symbol
+        clock.now += 1
+        primary.on_tick('silver', Tick(0, 0, 30, 0))
+        standby.on_tick('silver', Tick(0, 0, 30, 0))
+        feed._check()
+    assert feed.active == 0
+    assert [last for key, last in delivered if key == 'gold'][-1] == 105
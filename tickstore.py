@@ -0,0 +1,231 @@
+"""
+Tick storage for the wall clock.
+
+TickRing      - fixed-capacity, array-backed in-memory history per symbol.
+TickJournal   - append-only on-disk journal of accepted ticks, one file per UTC day.
+JournalReader - memory-mapped scan / replay of one journal file.
+"""
+
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+# Bar sizes accepted by /api/history, in seconds
+BAR_SECONDS = {'1s': 1, '1m': 60, '5m': 300}
+
+
+class TickRing:
+    """Last `capacity` ticks of one symbol as parallel (ts, price, bid, ask) float arrays.
+
+    Memory is allocated once (32 bytes per tick) and never grows; the oldest
+    tick is overwritten when the ring is full.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._ts = array('d', bytes(8 * capacity))
+        self._price = array('d', bytes(8 * capacity))
+        self._bid = array('d', bytes(8 * capacity))
+        self._ask = array('d', bytes(8 * capacity))
+        self._head = 0   # Next slot to write
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, ts, price, bid=0.0, ask=0.0):
+        with self._lock:
+            i = self._head
+            self._ts[i] = ts
+            self._price[i] = price
+            self._bid[i] = bid or 0.0
+            self._ask[i] = ask or 0.0
+            self._head = (i + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def _ordered(self, column):
+        # Oldest first; the ring wraps at _head once it is full
+        if self._count < self.capacity:
+            return column[:self._count]
+        return column[self._head:] + column[:self._head]
+
+    def snapshot(self, since=0.0):
+        """(ts, price, bid, ask) arrays in time order, from `since` onwards."""
+        with self._lock:
+            ts = self._ordered(self._ts)
+            price = self._ordered(self._price)
+            bid = self._ordered(self._bid)
+            ask = self._ordered(self._ask)
+        start = bisect_left(ts, since) if since else 0
+        return ts[start:], price[start:], bid[start:], ask[start:]
+
+    def ohlc(self, bar_seconds, since=0.0):
+        """OHLC bars built from the buffered ticks, as columnar lists.
+
+        Bar edges are located with a binary search over the (sorted) timestamps
+        and each bar's high/low is one min()/max() over an array slice, so the
+        per-tick work stays in C.
+        """
+        ts, price, _, _ = self.snapshot(since)
+        bars = {'t': [], 'o': [], 'h': [], 'l': [], 'c': [], 'n': []}
+        if not ts:
+            return bars
+        start = 0
+        end_ts = ts[-1]
+        bar_start = ts[0] // bar_seconds * bar_seconds
+        while start < len(ts):
+            next_start = bar_start + bar_seconds
+            stop = bisect_left(ts, next_start, start) if next_start <= end_ts else len(ts)
+            if stop > start:
+                window = price[start:stop]
+                bars['t'].append(bar_start)
+                bars['o'].append(window[0])
+                bars['h'].append(max(window))
+                bars['l'].append(min(window))
+                bars['c'].append(window[-1])
+                bars['n'].append(stop - start)
+                start = stop
+                bar_start = next_start
+            else:
+                # Skip empty bars in one step
+                bar_start = ts[start] // bar_seconds * bar_seconds
+        return bars
+
+
+# Journal file: 16-byte header, then fixed-width little-endian records
+JOURNAL_MAGIC = b'WCTJ'
+JOURNAL_LAYOUT = 1
+JOURNAL_HEADER = struct.Struct('<4sII4x')  # magic, layout, record size
+JOURNAL_RECORD = struct.Struct('<d24sddddd')  # ts, key, price, bid, ask, last, close
+
+
+def journal_path(directory, ts):
+    return os.path.join(directory, time.strftime('ticks-%Y%m%d.bin', time.gmtime(ts)))
+
+
+class TickJournal:
+    """Batched, append-only tick journal written from its own thread.
+
+    record() only puts a tuple on a queue, so the IB thread never waits on
+    disk. The writer wakes every `batch_interval` seconds, packs whatever
+    queued up into one buffer per day file and appends it in a single write.
+    Files older than `keep_days` are deleted when a new day starts.
+    """
+
+    def __init__(self, directory, batch_interval=0.25, keep_days=7):
+        self.directory = directory
+        self.batch_interval = batch_interval
+        self.keep_days = keep_days
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._file_path = None
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, name='tick-journal', daemon=True).start()
+
+    def record(self, ts, key, price, bid=0.0, ask=0.0, last=0.0, close=0.0):
+        self._queue.put((ts, key, price, bid or 0.0, ask or 0.0, last or 0.0, close or 0.0))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(self.batch_interval)  # Let a batch accumulate
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Tick journal write failed ({len(batch)} ticks dropped): {e}", flush=True)
+
+    def _write(self, batch):
+        buf = bytearray()
+        path = journal_path(self.directory, batch[0][0])
+        for ts, key, price, bid, ask, last, close in batch:
+            tick_path = journal_path(self.directory, ts)
+            if tick_path != path:
+                self._append(path, buf)
+                buf = bytearray()
+                path = tick_path
+            buf += JOURNAL_RECORD.pack(ts, key.encode('utf-8')[:24], price, bid, ask, last, close)
+        self._append(path, buf)
+
+    def _append(self, path, buf):
+        if not buf:
+            return
+        if path != self._file_path:
+            if self._file:
+                self._file.close()
+            self._file = open(path, 'ab')
+            self._file_path = path
+            if self._file.tell() == 0:
+                self._file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_LAYOUT, JOURNAL_RECORD.size))
+            self._prune()
+        self._file.write(buf)
+        self._file.flush()
+
+    def _prune(self):
+        cutoff = journal_path(self.directory, time.time() - self.keep_days * 86400)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('ticks-') and name.endswith('.bin') and path < cutoff:
+                os.remove(path)
+
+
+class JournalReader:
+    """Read-only, memory-mapped view of one journal file.
+
+    Records are decoded straight from the mapping with Struct.iter_unpack, so
+    scanning a full day is a single pass with no per-record file I/O. A
+    partially written trailing record (e.g. after a crash) is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < JOURNAL_HEADER.size:
+                raise ValueError("%s is not a tick journal" % path)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, layout, record_size = JOURNAL_HEADER.unpack_from(self._mm, 0)
+        if magic != JOURNAL_MAGIC or layout != JOURNAL_LAYOUT or record_size != JOURNAL_RECORD.size:
+            raise ValueError("%s is not a tick journal (layout %d)" % (path, JOURNAL_LAYOUT))
+        self.count = (size - JOURNAL_HEADER.size) // JOURNAL_RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Yield (ts, key, price, bid, ask, last, close) in file order."""
+        keys = {}
+        end = JOURNAL_HEADER.size + self.count * JOURNAL_RECORD.size
+        for ts, raw_key, price, bid, ask, last, close in JOURNAL_RECORD.iter_unpack(
+                memoryview(self._mm)[JOURNAL_HEADER.size:end]):
+            key = keys.get(raw_key)
+            if key is None:
+                key = keys[raw_key] = raw_key.rstrip(b'\0').decode('utf-8')
+            yield ts, key, price, bid, ask, last, close
+
+    def replay(self, handler, speed=None):
+        """Call handler(*record) for every tick; `speed` 1.0 = real time, None = as fast as possible."""
+        start_wall = time.time()
+        first_ts = None
+        for record in self:
+            if speed:
+                if first_ts is None:
+                    first_ts = record[0]
+                delay = (record[0] - first_ts) / speed - (time.time() - start_wall)
+                if delay > 0:
+                    time.sleep(delay)
+            handler(*record)
+
+    def close(self):
+        self._mm.close()
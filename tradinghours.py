@@ -0,0 +1,86 @@
+"""
+Trading hours - when an asset's market is expected to tick.
+
+Optional per asset in assets.json; without it a market counts as always open:
+
+    "hours": {"tz": "America/Chicago", "days": "sun-thu", "sessions": ["17:00-16:00"]}
+
+`days` are the weekdays sessions open on ("mon-fri", "sun-thu", "mon,wed"),
+`sessions` open-close times in `tz`. A close at or before the open is on the
+next day, so the example is CME Globex: Sunday 17:00 to Friday 16:00 with an
+hour's break every afternoon. Exchange holidays aren't known; on those a
+symbol looks stale instead of closed.
+
+For session statistics (analytics.py) a session runs from one open to the
+next, see session().
+"""
+
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def parse_days(text):
+    """Weekday numbers (Monday = 0) for "mon-fri", "sun-thu" (wraps) or "mon,wed"."""
+    days = set()
+    for part in text.lower().split(','):
+        first, _, last = part.strip().partition('-')
+        if first not in DAYS or (last and last not in DAYS):
+            raise ValueError("unknown day in %r (use mon..sun)" % text)
+        day = DAYS.index(first)
+        days.add(day)
+        while last and day != DAYS.index(last):
+            day = (day + 1) % 7
+            days.add(day)
+    return sorted(days)
+
+
+def parse_minutes(text):
+    hours, _, minutes = text.strip().partition(':')
+    if not (hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60):
+        raise ValueError("bad time %r (use HH:MM)" % text)
+    return int(hours) * 60 + int(minutes)
+
+
+class TradingHours:
+    def __init__(self, spec):
+        """`spec` as in assets.json; raises ValueError if it doesn't parse."""
+        if not isinstance(spec, dict) or not isinstance(spec.get('sessions'), list) or not spec['sessions']:
+            raise ValueError("hours need tz, days and a list of sessions")
+        try:
+            self.tz = ZoneInfo(spec.get('tz', 'UTC'))
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError("unknown time zone %r" % spec.get('tz'))
+        days = parse_days(spec.get('days', 'mon-fri'))
+        self.sessions = []  # (weekday it opens, minute of the day it opens, length in minutes)
+        for session in spec['sessions']:
+            opens, _, closes = str(session).partition('-')
+            start, end = parse_minutes(opens), parse_minutes(closes)
+            length = end - start if end > start else end + 1440 - start
+            self.sessions.extend((day, start, length) for day in days)
+
+    def is_open(self, when):
+        """Whether a session is running at epoch `when`."""
+        local = datetime.fromtimestamp(when, self.tz)
+        minute = local.hour * 60 + local.minute
+        for days_ago in (0, 1):  # Opened today, or yesterday and running past midnight
+            weekday = (local.weekday() - days_ago) % 7
+            for day, start, length in self.sessions:
+                if day == weekday and 0 <= minute + days_ago * 1440 - start < length:
+                    return True
+        return False
+
+    def session(self, when):
+        """(start, next start) epochs of the latest session opened at or before `when` and the one after it."""
+        today = datetime.fromtimestamp(when, self.tz).date()
+        opens = []
+        for offset in range(-7, 8):
+            day = today + timedelta(days=offset)
+            opens.extend(
+                datetime.combine(day, time(start // 60, start % 60), self.tz).timestamp()
+                for weekday, start, _ in self.sessions if weekday == day.weekday()
+            )
+        opens.sort()
+        index = next(i for i, opened in enumerate(opens) if opened > when)
+        return opens[index - 1], opens[index]